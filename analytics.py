@@ -1,6 +1,9 @@
 from datetime import datetime
+#Timings for --profile
+from profiling import instrument
 
 #Calculation of the average time between completions of a habit
+@instrument("analytics.average_completion_time")
 def average_completion_time(completion_dates):
     #Need enough data for the calculation
     if len(completion_dates) <2:
@@ -13,6 +16,7 @@ def average_completion_time(completion_dates):
     return sum(time_differences) / len(time_differences)
 
 #Calculation of the habit with the most consistent completions
+@instrument("analytics.most_consistent_habit")
 def most_consistent_habit(habit_data):
     def consistency_score(dates):
         if len(dates) <2:
@@ -26,6 +30,7 @@ def most_consistent_habit(habit_data):
     return min(habit_data, key=lambda habit: consistency_score(habit_data[habit]))
 
 #Calculation of total and average streaks across all habits
+@instrument("analytics.aggregate_streak_analysis")
 def aggregate_streak_analysis(habit_data):
     def count_streaks(dates):
         if not dates:
@@ -51,3 +56,74 @@ def aggregate_streak_analysis(habit_data):
     total_streaks = sum(count_streaks(dates) for dates in habit_data.values())
     avg_streaks = total_streaks / len(habit_data) if habit_data else 0
     return {"total streaks" : total_streaks, "average streaks" : avg_streaks}
+
+#Largest gap in days between two completions that does not break the streak
+STREAK_BREAK_GAPS = {"daily": 1, "weekly": 7, "monthly": 30}
+
+#Calculation of all analytics of one habit with a single sort and a single pass over the gaps
+@instrument("analytics.habit_summary")
+def habit_summary(completion_dates, periodicity=None):
+    return summarize_ordered(sorted(completion_dates), periodicity)
+
+#Calculation of all analytics of one habit in a single pass over its completion dates in ascending order
+#Accepts any iterable (e.g. database.iter_completion_history), only the previous date is kept in memory
+@instrument("analytics.summarize_ordered")
+def summarize_ordered(completion_dates, periodicity=None):
+    total_completions = 0
+    previous_date = None
+    gap_sum = 0
+    min_gap = max_gap = None
+    streaks = 0
+    longest_run = 0
+    current_run = 1
+    streak_breaks = 0
+    break_gap = STREAK_BREAK_GAPS.get(periodicity)
+
+    for completion_date in completion_dates:
+        total_completions += 1
+        if previous_date is None:
+            previous_date = completion_date
+            longest_run = 1
+            continue
+        gap = (completion_date - previous_date).days
+        previous_date = completion_date
+        gap_sum += gap
+        if min_gap is None or gap < min_gap:
+            min_gap = gap
+        if max_gap is None or gap > max_gap:
+            max_gap = gap
+        #Runs of completions on consecutive days
+        if gap == 1:
+            current_run += 1
+            longest_run = max(longest_run, current_run)
+        else:
+            if current_run > 1:
+                streaks += 1
+            current_run = 1
+        #Streak breaks based on the periodicity
+        if break_gap is not None and gap > break_gap:
+            streak_breaks += 1
+    #Checking the last streak
+    if current_run > 1:
+        streaks += 1
+
+    has_gaps = total_completions >= 2
+    return {
+        "total completions": total_completions,
+        "average gap": gap_sum / (total_completions - 1) if has_gaps else None,
+        "min gap": min_gap,
+        "max gap": max_gap,
+        #The smaller the score, the more consistent it is
+        "consistency score": max_gap - min_gap if has_gaps else float('inf'),
+        "streak count": streaks,
+        "longest run": longest_run,
+        "streak breaks": streak_breaks,
+    }
+
+#Most consistent habit and streak totals from the habit_summary results of several habits
+@instrument("analytics.summaries_overview")
+def summaries_overview(summaries):
+    consistent_habit = min(summaries, key=lambda habit: summaries[habit]["consistency score"])
+    total_streaks = sum(summary["streak count"] for summary in summaries.values())
+    avg_streaks = total_streaks / len(summaries) if summaries else 0
+    return consistent_habit, {"total streaks" : total_streaks, "average streaks" : avg_streaks}
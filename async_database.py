@@ -0,0 +1,152 @@
+#Asyncio data-access API, for embedding HabitTracker in an async service
+"""
+The coroutines mirror the functions of database.py. The blocking driver calls run on a thread pool
+with as many threads as the connection pool has connections, so they never wait for a connection
+and never block the event loop:
+
+async with AsyncHabitDatabase() as database:
+    habits = await database.get_habits_by_user(user_id)
+    analytics = await user_analytics(database, user_id)
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from database import POOL_SIZE, get_database
+from analytics import summarize_ordered, summaries_overview
+
+class AsyncHabitDatabase:
+    def __init__(self, database=None, max_workers=POOL_SIZE):
+        #The shared data-access object is created in a worker thread by the first query
+        self._database = database
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="habittracker-db")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    #Runs function(blocking data-access object, *args) in the thread pool
+    async def _run_with_database(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, function, *args))
+
+    def _call(self, function, *args):
+        return function(self._database or get_database(), *args)
+
+    #Runs a method of the blocking data-access object in the thread pool
+    async def _run(self, method_name, *args):
+        return await self._run_with_database(lambda database: getattr(database, method_name)(*args))
+
+    #Waits for running queries, the shared connection pool stays open (see database.close_database)
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    #Same as close, but waits in another thread so the event loop keeps running
+    async def aclose(self):
+        await asyncio.to_thread(self._executor.shutdown, True)
+
+    async def insert_new_user(self, username_input, hashed_password):
+        return await self._run("insert_new_user", username_input, hashed_password)
+
+    async def get_user_by_username(self, entry_username):
+        return await self._run("get_user_by_username", entry_username)
+
+    async def get_user_password(self, user_id):
+        return await self._run("get_user_password", user_id)
+
+    async def update_user_password(self, user_id, hashed_password):
+        return await self._run("update_user_password", user_id, hashed_password)
+
+    async def insert_new_habit(self, habit_name, periodicity, user_id):
+        return await self._run("insert_new_habit", habit_name, periodicity, user_id)
+
+    async def delete_habit(self, habit_id, user_id):
+        return await self._run("delete_habit", habit_id, user_id)
+
+    async def display_habits_for_deletion(self, user_id):
+        return await self._run("display_habits_for_deletion", user_id)
+
+    async def insert_habit_completion(self, habit_id, completed_at=None):
+        return await self._run("insert_habit_completion", habit_id, completed_at)
+
+    async def insert_habit_completions(self, habit_ids, completed_at=None):
+        return await self._run("insert_habit_completions", habit_ids, completed_at)
+
+    async def rebuild_habit_streaks(self, habit_ids=None):
+        return await self._run("rebuild_habit_streaks", habit_ids)
+
+    async def compute_streaks(self, habit_ids, engine=None):
+        return await self._run("compute_streaks", habit_ids, engine)
+
+    async def get_habit_streak(self, habit_id):
+        return await self._run("get_habit_streak", habit_id)
+
+    async def get_habit_streaks_by_user(self, user_id):
+        return await self._run("get_habit_streaks_by_user", user_id)
+
+    async def get_habits_by_user(self, user_id):
+        return await self._run("get_habits_by_user", user_id)
+
+    async def get_completion_history_for_habit(self, habit_id, since=None, until=None):
+        return await self._run("get_completion_history_for_habit", habit_id, since, until)
+
+    #Streaming queries are read in the thread pool, so the coroutine returns a list (oldest first)
+    async def iter_completion_history(self, habit_id, since=None, until=None):
+        return await self._run_with_database(
+            lambda database: list(database.iter_completion_history(habit_id, since=since, until=until)))
+
+    #Summary of a habit (analytics.summarize_ordered), computed in the thread pool while its completions are streamed
+    async def summarize_completion_history(self, habit_id, periodicity=None, since=None, until=None):
+        return await self._run_with_database(
+            lambda database: summarize_ordered(database.iter_completion_history(habit_id, since=since, until=until),
+                                               periodicity))
+
+    async def get_completion_history_for_habits(self, habit_ids, since=None, until=None):
+        return await self._run("get_completion_history_for_habits", habit_ids, since, until)
+
+    async def get_completion_history_for_user(self, user_id, since=None, until=None):
+        return await self._run("get_completion_history_for_user", user_id, since, until)
+
+    async def get_habits_by_periodicity(self, user_id, periodicity):
+        return await self._run("get_habits_by_periodicity", user_id, periodicity)
+
+
+#Async versions of the streak and analytics commands of cli.py, they return the results instead of printing them
+#The analytics take the same optional time window as the commands (since and until are dates, both inclusive)
+
+#Summaries of all habits of a user (habit name -> summarize_ordered), the habits are streamed concurrently
+async def habit_summaries(database, user_id, since=None, until=None):
+    habits = await database.get_habits_by_user(user_id)
+    summaries = await asyncio.gather(*(database.summarize_completion_history(habit[0], habit[2], since, until)
+                                       for habit in habits))
+    return {habit[1]: summary for habit, summary in zip(habits, summaries)}
+
+#Same results as cli.view_analytics (None if the user has no habits)
+async def user_analytics(database, user_id, since=None, until=None):
+    summaries = await habit_summaries(database, user_id, since, until)
+    if not summaries:
+        return None
+    consistent_habit, streak_summary = summaries_overview(summaries)
+    return {"average completion time": {habit: summary["average gap"] for habit, summary in summaries.items()},
+            "most consistent habit": consistent_habit,
+            "aggregate streaks": streak_summary}
+
+#Same result as cli.display_most_challenging_habit: (habit name, streak breaks), or None
+async def most_challenging_habit(database, user_id, since=None, until=None):
+    summaries = await habit_summaries(database, user_id, since, until)
+    habit_name, streak_breaks = max(((habit, summary["streak breaks"]) for habit, summary in summaries.items()),
+                                    key=lambda item: item[1], default=(None, 0))
+    return (habit_name, streak_breaks) if streak_breaks else None
+
+#Current and longest streak of every habit: habit name -> (current, longest)
+#The streaks are stored with the habits, so one query reads all of them
+async def user_streaks(database, user_id):
+    habits = await database.get_habit_streaks_by_user(user_id)
+    return {habit[1]: (habit[3], habit[4]) for habit in habits}
+
+#Same result as cli.view_longest_streak_across_all_habits: (habit name, longest streak), or None
+async def longest_streak_across_all_habits(database, user_id):
+    streaks = await user_streaks(database, user_id)
+    habit_name, (_, longest_streak) = max(streaks.items(), key=lambda item: item[1][1], default=(None, (0, 0)))
+    return (habit_name, longest_streak) if longest_streak else None
@@ -0,0 +1,184 @@
+#Benchmark suite for streaks, analytics, database queries and CLI commands
+"""
+Generates a seeded data set, loads it into the test database and writes the timings as JSON:
+python benchmark.py --users 20 --habits 10 --years 3 --output bench.json
+Compare a run with an earlier one (exits with an error if something got slower than the tolerance):
+python benchmark.py --output new.json --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import analytics
+import cli
+import database
+import numpy_analytics
+import result_cache
+from habit import Habit, CompactHabit
+from transfer import import_records
+
+#Probability that a habit is completed in one of its periods
+COMPLETION_RATE = 0.8
+PERIODICITIES = ["daily", "weekly", "monthly"]
+
+#Seeded data generator, yields import records (users, then habits, then completions, see transfer.py)
+def generate_dataset(users, habits_per_user, years, seed=0, prefix="bench"):
+    rng = random.Random(seed)
+    end = datetime(2024, 1, 1)
+    start = end - timedelta(days=365 * years)
+    usernames = [f"{prefix}_user_{i}" for i in range(users)]
+    habits = [(i * habits_per_user + j + 1, usernames[i], PERIODICITIES[j % len(PERIODICITIES)])
+              for i in range(users) for j in range(habits_per_user)]
+
+    for username in usernames:
+        yield {"type": "user", "username": username, "password": "benchmark"}
+    for habit_id, username, periodicity in habits:
+        yield {"type": "habit", "habit_id": habit_id, "username": username, "habitname": f"Habit {habit_id}",
+               "periodicity": periodicity, "created_at": start.isoformat(sep=" ")}
+    for habit_id, _, periodicity in habits:
+        for completion in _completion_dates(rng, periodicity, start, end):
+            yield {"type": "completion", "habit_id": habit_id, "completedate": completion.isoformat(sep=" ")}
+
+#Completion dates of one habit, one chance per period with a random time of day
+def _completion_dates(rng, periodicity, start, end):
+    day = start
+    while day < end:
+        if rng.random() < COMPLETION_RATE:
+            yield day + timedelta(seconds=rng.randint(0, 86399))
+        if periodicity == "daily":
+            day += timedelta(days=1)
+        elif periodicity == "weekly":
+            day += timedelta(days=7)
+        else:
+            day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+#Runs a function several times with its console output discarded, returns the timing statistics
+def time_call(function, repeat):
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+    return {"calls": repeat, "total_seconds": sum(timings), "mean_seconds": sum(timings) / repeat,
+            "min_seconds": min(timings)}
+
+#Loads the data set unless a previous run with the same parameters already did
+def load_dataset(args):
+    usernames = [f"{args.prefix}_user_{i}" for i in range(args.users)]
+    if all(database.get_user_by_username(username) for username in usernames):
+        return usernames, None
+    rows, seconds = import_records(generate_dataset(args.users, args.habits, args.years, args.seed, args.prefix))
+    return usernames, {"rows": rows, "seconds": seconds, "rows_per_second": rows / max(seconds, 1e-9)}
+
+def run_benchmarks(args):
+    usernames, load = load_dataset(args)
+    user_ids = [database.get_user_by_username(username)[0] for username in usernames]
+    habits = [habit for user_id in user_ids for habit in database.get_habits_by_user(user_id)]
+    history = database.get_completion_history_for_habits([habit[0] for habit in habits])
+    habit_data = {habit[1]: history[habit[0]] for habit in habits}
+    user_id, habit_id = user_ids[0], habits[0][0]
+    repeat = args.repeat
+
+    def calculate_all_streaks():
+        for habit in habits:
+            habit_object = Habit(name=habit[1], periodicity=habit[2])
+            habit_object.completion_history = list(history[habit[0]])
+            habit_object.calculate_streak()
+
+    def calculate_all_compact_streaks():
+        for habit in habits:
+            CompactHabit.from_rows(habit[1], habit[2], [(date,) for date in history[habit[0]]]).calculate_streak()
+
+    benchmarks = {
+        #Streaks
+        "habit.calculate_streak": calculate_all_streaks,
+        "habit.CompactHabit.calculate_streak": calculate_all_compact_streaks,
+        #Analytics
+        "analytics.average_completion_time": lambda: [analytics.average_completion_time(dates) for dates in habit_data.values()],
+        "analytics.most_consistent_habit": lambda: analytics.most_consistent_habit(habit_data),
+        "analytics.aggregate_streak_analysis": lambda: analytics.aggregate_streak_analysis(habit_data),
+        "analytics.habit_summary": lambda: [analytics.habit_summary(dates) for dates in habit_data.values()],
+        "numpy_analytics.average_completion_time": lambda: [numpy_analytics.average_completion_time(dates) for dates in habit_data.values()],
+        "numpy_analytics.most_consistent_habit": lambda: numpy_analytics.most_consistent_habit(habit_data),
+        "numpy_analytics.aggregate_streak_analysis": lambda: numpy_analytics.aggregate_streak_analysis(habit_data),
+        #Database queries (for one user or habit)
+        "database.get_user_by_username": lambda: database.get_user_by_username(usernames[0]),
+        "database.get_habits_by_user": lambda: database.get_habits_by_user(user_id),
+        "database.get_habits_by_periodicity": lambda: database.get_habits_by_periodicity(user_id, "daily"),
+        "database.get_habit_streaks_by_user": lambda: database.get_habit_streaks_by_user(user_id),
+        "database.get_completion_history_for_habit": lambda: database.get_completion_history_for_habit(habit_id),
+        "database.iter_completion_history": lambda: analytics.summarize_ordered(database.iter_completion_history(habit_id)),
+        "database.get_completion_history_for_user": lambda: database.get_completion_history_for_user(user_id),
+        "database.stream_completion_seconds": lambda: list(database.stream_completion_seconds([habit_id])),
+        "database.compute_streaks.python": lambda: database.compute_streaks([habit_id], "python"),
+        "database.compute_streaks.sql": lambda: database.compute_streaks([habit_id], "sql"),
+        #Full CLI commands (for one user)
+        "cli.display_user_habits": lambda: cli.display_user_habits(user_id),
+        "cli.view_longest_streak_across_all_habits": lambda: cli.view_longest_streak_across_all_habits(user_id),
+        "cli.display_most_challenging_habit": lambda: cli.display_most_challenging_habit(user_id),
+        "cli.view_analytics": lambda: cli.view_analytics(user_id),
+    }
+    return {
+        "parameters": {"users": args.users, "habits_per_user": args.habits, "years": args.years, "seed": args.seed,
+                       "repeat": repeat, "completions": sum(len(dates) for dates in history.values())},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "load": load,
+        "results": {name: time_call(function, repeat) for name, function in benchmarks.items()},
+    }
+
+#Benchmarks whose best time got slower than the baseline by more than the tolerance
+def find_regressions(report, baseline, tolerance):
+    regressions = []
+    for name, result in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous and result["min_seconds"] > previous["min_seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: {previous['min_seconds']:.6f}s -> {result['min_seconds']:.6f}s")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HabitTracker benchmarks")
+    parser.add_argument("--users", type=int, default=10, help="Number of generated users.")
+    parser.add_argument("--habits", type=int, default=9, help="Habits per user (spread over all periodicities).")
+    parser.add_argument("--years", type=int, default=2, help="Years of completion history.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data generator.")
+    parser.add_argument("--prefix", type=str, default="bench", help="Prefix of the generated usernames.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark.")
+    parser.add_argument("--database", type=str, default="testdatabase", help="Database to load the data into.")
+    parser.add_argument("--output", type=str, help="JSON file for the results (default: print them).")
+    parser.add_argument("--compare", type=str, help="JSON results of an earlier run to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown when comparing (0.2 = 20%%).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    database.DB_CONFIG["database"] = args.database
+    #The CLI commands are timed without reusing cached results (a cache of size 0 never hits)
+    result_cache._result_cache = result_cache.ResultCache(result_cache.MemoryBackend(), size=0)
+    #The benchmark user name must be unique per data set
+    args.prefix = f"{args.prefix}_{args.users}_{args.habits}_{args.years}_{args.seed}"
+    report = run_benchmarks(args)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = find_regressions(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -7,50 +7,320 @@ python cli.py :An interactive menu will show up where users can select the same
 """
 #import libraries
 import argparse
+import atexit
 import bcrypt
+import calendar
 import getpass
+import json
+import sys
+from collections import Counter
+from datetime import date, timedelta
+from itertools import groupby
+import profiling
 from habit import Habit
 #calls function from database to handle database operations
 from database import (insert_new_user, get_user_by_username, insert_new_habit, 
                       delete_habit, display_habits_for_deletion, get_habits_by_user, 
-                      insert_habit_completion, get_completion_history_for_habit, 
-                      get_habits_by_periodicity)
+                      insert_habit_completions, 
+                      stream_completion_history, get_habits_by_periodicity, get_period_counts_by_user,
+                      get_habit_streaks_by_user, get_user_password, update_user_password, get_database_id, rebuild_habit_completion_counts,
+                      rebuild_habit_streaks, rebuild_habit_rollups,
+                      migrate, check_query_plans, SchemaVersionError)
 #import from analytics.py
-from analytics import average_completion_time, most_consistent_habit, aggregate_streak_analysis
+from analytics import summarize_ordered, summaries_overview
+#import from transfer.py
+from transfer import import_data, export_data, FILE_FORMATS
+#import from habit_cache.py (habits of the interactive menu)
+from habit_cache import HabitCache
+#import from result_cache.py (results reused while the user's data is unchanged)
+from result_cache import cached_result
+#import from report.py
+from report import run_report, REPORT_TOP_K
+#import from reminders.py
+from reminders import scan_broken_habits, SCAN_SHARDS
+#import from session.py
+from session import issue_token, verify_token, load_token, revoke_sessions
+
+#bcrypt is slow by design, --profile shows its time separately
+hashpw = profiling.instrument("bcrypt.hashpw")(bcrypt.hashpw)
+checkpw = profiling.instrument("bcrypt.checkpw")(bcrypt.checkpw)
 
 
 #Definition of functions that are called later
-#Definition of create_habit function
-def create_habit(user_id):
-    print("Create a new habit: ")
-    habit_name = input("Please enter the name of the new habit: ")
-    periodicity = input("Please enter the periodicity (daily, weekly, monthly): ")
-
-    if periodicity.lower() not in ['daily', 'weekly', 'monthly']:
-        print("Invalid periodicity. Please enter one of the pre-selected ones.")
+#The functions take an optional HabitCache (interactive menu), which replaces the database reads
+#Without it the results of the streak and analytics queries come from the result cache if the user's data is unchanged
+#The streak and analytics functions take an optional time window (since and until are dates, both inclusive)
+
+#Function to check if a completion is in the time window
+def in_window(completed_at, since=None, until=None):
+    return (since is None or completed_at.date() >= since) and (until is None or completed_at.date() <= until)
+
+#Function to stream the completion dates of habits in date order as (habit ID, dates) pairs,
+#from the HabitCache or from one database query that only reads the time window
+def completion_groups(habit_ids, cache=None, since=None, until=None):
+    if cache:
+        for habit_id in habit_ids:
+            yield habit_id, (completed_at for completed_at in cache.iter_completion_history(habit_id)
+                             if in_window(completed_at, since, until))
         return
+    for habit_id, rows in groupby(stream_completion_history(habit_ids, since, until), key=lambda row: row[0]):
+        yield habit_id, (row[1] for row in rows)
+
+#Function to get the habits of the user with their streaks: the stored streaks, or with a time window
+#the streaks of the completions in the window
+def user_habit_streaks(user_id, cache=None, since=None, until=None):
+    if since is None and until is None:
+        if cache:
+            return cache.get_habit_streaks_by_user()
+        return cached_result(user_id, "habit streaks", lambda: get_habit_streaks_by_user(user_id))
+    def compute():
+        habits = cache.get_habits_by_user() if cache else get_habits_by_user(user_id)
+        periodicities = {habit[0]: habit[2] for habit in habits}
+        streaks = {}
+        for habit_id, completion_dates in completion_groups(list(periodicities), cache, since, until):
+            habit = Habit(name=habit_id, periodicity=periodicities[habit_id])
+            habit.streak_from_completions(completion_dates)
+            streaks[habit_id] = (habit.streak, habit.longest_streak, habit.last_completed)
+        return [(*habit[:3], *streaks.get(habit[0], (0, 0, None))) for habit in habits]
+    return compute() if cache else cached_result(user_id, f"habit streaks {since} {until}", compute)
+
+#Results of the actions as data, written as text by the functions below or as JSON by --format json
+#Invalid input raises ActionError with the message for the user
+class ActionError(Exception):
+    pass
+
+PERIODICITIES = ["daily", "weekly", "monthly"]
+#Output formats of the command line actions
+OUTPUT_FORMATS = ["text", "json"]
+
+#Function to describe a habit row (habit ID, name, periodicity, ...) in a result
+def habit_record(habit):
+    return {"id": habit[0], "name": habit[1], "periodicity": habit[2]}
+
+#Function to get the habits of the user with their completion count and last completion (no completion history is read)
+def user_habits_result(user_id, cache=None):
+    habits = cache.get_habits_by_user() if cache else get_habits_by_user(user_id)
+    return {"habits": [{**habit_record(habit), "completions": habit[3], "last completed": habit[4]} for habit in habits]}
+
+#Function to get the streaks of the user's habits, or of one habit
+def habit_streaks_result(user_id, cache=None, since=None, until=None, habit_id=None):
+    habits = user_habit_streaks(user_id, cache, since, until)
+    if habit_id is not None:
+        habits = [habit for habit in habits if habit[0] == habit_id]
+        if not habits:
+            raise ActionError("Invalid habit ID. Please select a valid habit ID.")
+    return {"habits": [{**habit_record(habit), "current streak": habit[3], "longest streak": habit[4],
+                        "last completed": habit[5]} for habit in habits]}
+
+#Function to get the habit with the longest streak (the stored streaks are compared, nothing is recalculated)
+def longest_streak_result(user_id, cache=None, since=None, until=None):
+    habits = user_habit_streaks(user_id, cache, since, until)
+    habit = max(habits, key=lambda habit: habit[4], default=None)
+    if habit is None or not habit[4]:
+        return {"habit": None, "longest streak": 0}
+    return {"habit": habit_record(habit), "longest streak": habit[4]}
+
+#Function to get the habit with the most streak breaks
+def most_challenging_habit_result(user_id, cache=None, since=None, until=None):
+    habits, summaries = user_habit_summaries(user_id, cache, since, until)
+    habit = max(habits, key=lambda habit: summaries[habit[0]]["streak breaks"], default=None)
+    streak_breaks = summaries[habit[0]]["streak breaks"] if habit else 0
+    return {"habit": habit_record(habit) if streak_breaks else None, "streak breaks": streak_breaks}
+
+#Function to get the habits of one periodicity, or of all periodicities, with their completion counts
+def habit_groups_result(user_id, cache=None, periodicity=None):
+    if periodicity is not None:
+        if periodicity not in PERIODICITIES:
+            raise ActionError("Invalid periodicity. Please enter one of the pre-selected ones.")
+        habits = cache.get_habits_by_periodicity(periodicity) if cache else get_habits_by_periodicity(user_id, periodicity)
+        periodicities = [periodicity]
+    else:
+        habits = cache.get_habits_by_user() if cache else get_habits_by_user(user_id)
+        periodicities = PERIODICITIES
+    groups = {periodicity: [] for periodicity in periodicities}
+    for habit in habits:
+        #The completion count is the second to last column of both queries
+        groups[habit[2]].append({"id": habit[0], "name": habit[1], "completions": habit[-2]})
+    return groups
 
-    #Save habit to database
-    insert_new_habit(habit_name, periodicity.lower(), user_id)
-    print(f"Habit '{habit_name}' created successfully!")
-
- #Definition of delete_function
-def delete_habit_prompt(user_id):
-    #Get habits for the user by calling display function from database.py
-    habits = display_habits_for_deletion(user_id)
-    #Loops through the habits of that user or returns an error message if there are none
+#Function to get the analytics of the user's habits (same result as async_database.user_analytics)
+def analytics_result(user_id, cache=None, since=None, until=None):
+    habits, summaries_by_id = user_habit_summaries(user_id, cache, since, until)
+    if not habits:
+        return {"average completion time": {}, "most consistent habit": None, "aggregate streaks": None}
+    summaries = {habit[1]: summaries_by_id[habit[0]] for habit in habits}
+    consistent_habit, streak_summary = summaries_overview(summaries)
+    return {"average completion time": {habit: summary["average gap"] for habit, summary in summaries.items()},
+            "most consistent habit": consistent_habit,
+            "aggregate streaks": streak_summary}
+
+#Function to get the completions per day of a year
+def calendar_result(user_id, year=None, cache=None):
+    year = year or date.today().year
+    day_counts = user_day_counts(user_id, year, cache)
+    return {"year": year, "completions": sum(day_counts.values()),
+            "days": {day.isoformat(): completions for day, completions in sorted(day_counts.items())}}
+
+#Function to create a habit
+def create_habit_result(user_id, habit_name, periodicity, cache=None):
+    periodicity = (periodicity or "").lower()
+    if not habit_name:
+        raise ActionError("Invalid input. The habit name cannot be empty.")
+    if periodicity not in PERIODICITIES:
+        raise ActionError("Invalid periodicity. Please enter one of the pre-selected ones.")
+    habit_id = cache.insert_new_habit(habit_name, periodicity) if cache else insert_new_habit(habit_name, periodicity, user_id)
+    return {"id": habit_id, "name": habit_name, "periodicity": periodicity}
+
+#Function to delete a habit of the user
+def delete_habit_result(user_id, habit_id, cache=None):
+    success = cache.delete_habit(habit_id) if cache else delete_habit(habit_id, user_id)
+    if not success:
+        raise ActionError("Failed to delete habit. Please enter the correct habit ID")
+    return {"deleted": habit_id}
+
+#Function to complete habits of the user: a list of IDs (strings or numbers) or ["all"]
+def complete_habits_result(user_id, habit_ids, cache=None):
+    #Get the user's habits
+    habits = cache.get_habits_by_user() if cache else get_habits_by_user(user_id)
     if not habits:
-        print("You have no habits to delete.")
+        raise ActionError("You have no habits to complete.")
+
+    habit_ids = [str(habit_id) for habit_id in habit_ids]
+    if habit_ids == ["all"]:
+        habit_ids = [str(habit[0]) for habit in habits]
+    if not habit_ids or not all(habit_id.isdigit() for habit_id in habit_ids):
+        raise ActionError("Invalid input. Please enter a number.")
+
+    #Make sure the habits belong to the user (checked against the habits loaded above)
+    habits_by_id = {habit[0]: habit for habit in habits}
+    selected_habits = [habits_by_id.get(int(habit_id)) for habit_id in dict.fromkeys(habit_ids)]
+    if not all(selected_habits):
+        raise ActionError("Invalid habit ID. Please select a valid habit.")
+
+    #Insert all completions into the database in one transaction
+    if cache:
+        cache.insert_habit_completions([habit[0] for habit in selected_habits])
+    else:
+        insert_habit_completions([habit[0] for habit in selected_habits])
+    return {"completed": [habit_record(habit) for habit in selected_habits]}
+
+#Function to create an account
+def create_account_result(username, password):
+    if not username or not password:
+        raise ActionError("Username and password are required to create an account.")
+    hashed_password = hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    insert_new_user(username, hashed_password.decode('utf-8'))
+    return {"username": username}
+
+#Function to change the password of the logged in user (revokes the saved sessions)
+#The current password is checked first, a saved session alone is not enough to take over the account
+def change_password_result(user_id, current_password, new_password):
+    stored_hashed_password = get_user_password(user_id)
+    if stored_hashed_password is None:
+        raise ActionError("User not found. Please log in again.")
+    if not current_password or not checkpw(current_password.encode('utf-8'), stored_hashed_password.encode('utf-8')):
+        raise ActionError("Incorrect password. The password was not changed.")
+    if not new_password:
+        raise ActionError("Invalid input. The password cannot be empty.")
+    hashed_password = hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
+    if not update_user_password(user_id, hashed_password.decode('utf-8')):
+        raise ActionError("User not found. Please log in again.")
+    revoke_sessions()
+    return {"password changed": True}
+
+#Function to describe a report of run_report
+def report_result(report):
+    return {"habits": report["habits"], "completions": report["completions"], "shards": report["shards"],
+            "broken streaks": report["broken streaks"],
+            "longest streaks": [{"id": habit_id, "name": habit_name, "user": user_id, "longest streak": longest_streak}
+                                for longest_streak, habit_id, user_id, habit_name in report["longest streaks"]],
+            "most challenging habits": [{"id": habit_id, "name": habit_name, "user": user_id, "streak breaks": streak_breaks}
+                                        for streak_breaks, habit_id, user_id, habit_name in report["most challenging habits"]]}
+
+#Function to log in with the password or with a session token (given or saved by an earlier login)
+#Returns (user ID, True if a new session was saved)
+def authenticate(args):
+    #Without a username and password the token is used, no bcrypt needed
+    #(--password alone is the current password of --change_password)
+    if not args.username or not args.password:
+        token = args.token or load_token()
+        #A session is only valid for the database it was issued for
+        user_id = verify_token(token, get_database_id())
+        if user_id is None:
+            if token:
+                raise ActionError("Your session has expired, was revoked or belongs to another database. "
+                                  "Please log in with your password.")
+            raise ActionError("Username and password are required for login.")
+        #A session of another user is not used for --username (one indexed lookup, no bcrypt)
+        if args.username:
+            user_data = get_user_by_username(args.username)
+            if user_data is None or user_data[0] != user_id:
+                raise ActionError(f"The saved session doesn't belong to '{args.username}'. Please log in with your password.")
+        return user_id, False
+
+    user_data = get_user_by_username(args.username)
+    if user_data is None:
+        raise ActionError("Username not found. Please try again or create an account.")
+
+    stored_user_id, stored_hashed_password = user_data
+    if not checkpw(args.password.encode('utf-8'), stored_hashed_password.encode('utf-8')):
+        raise ActionError("Incorrect password. Please try again.")
+
+    #Save a session so that the next commands don't need the password
+    issue_token(stored_user_id, get_database_id())
+    return stored_user_id, True
+
+
+#Output of the actions, written in one call instead of one call per line
+#Function to write lines of text
+def write_lines(lines):
+    sys.stdout.write("".join(f"{line}\n" for line in lines))
+
+#Function to convert the values of a result that JSON doesn't know (dates and times as ISO 8601 strings)
+def json_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+#Function to write a result as one JSON document
+def write_json(result):
+    sys.stdout.write(json.dumps(result, default=json_value) + "\n")
+
+
+#Text output of the actions
+#Function to format a list of habits
+def habit_lines(habits):
+    return ["Your habits: "] + [f"ID: {habit['id']} | Name: {habit['name']} | Periodicity: {habit['periodicity']}"
+                                for habit in habits]
+
+#Definition of create_habit function
+def create_habit(user_id, cache=None, habit_name=None, periodicity=None):
+    if habit_name is None or periodicity is None:
+        print("Create a new habit: ")
+        habit_name = input("Please enter the name of the new habit: ")
+        periodicity = input("Please enter the periodicity (daily, weekly, monthly): ")
+    try:
+        habit = create_habit_result(user_id, habit_name, periodicity, cache)
+    except ActionError as error:
+        print(error)
         return
-    
-    print("Your habits: ")
-    for habit in habits:
-        print(f"ID: {habit[0]} | Name: {habit[1]} | Periodicity: {habit[2]}")
-    
-    #Prompt for habit ID to delete habit
-    habit_id = input("Please enter the ID of the habit you want to delete: ")
+    print(f"Habit '{habit['name']}' created successfully!")
+
+ #Definition of delete_function
+def delete_habit_prompt(user_id, cache=None, habit_id=None):
+    if habit_id is None:
+        #Get habits for the user by calling display function from database.py
+        habits = cache.get_habits_by_user() if cache else display_habits_for_deletion(user_id)
+        #Lists the habits of that user or returns an error message if there are none
+        if not habits:
+            print("You have no habits to delete.")
+            return
+        write_lines(habit_lines([habit_record(habit) for habit in habits]))
+
+        #Prompt for habit ID to delete habit
+        habit_id = input("Please enter the ID of the habit you want to delete: ")
     #Only allow numbers
-    if not habit_id.isdigit():
+    if not str(habit_id).isdigit():
         print("Invalid input. Please enter a number as a habit ID.")
         return
     
@@ -59,306 +329,240 @@ def delete_habit_prompt(user_id):
     #Confirm deletion to ensure the user doesN#t accidentally delete a habit
     confirm = input(f"Are you sure you want to delete habit {habit_id}? (yes / no): ")
     if confirm == "yes":
-        success = delete_habit(habit_id, user_id)
-        if success:
-            print("Habit deleted successfully!")
-        else:
-            print("Failed to delete habit. Please enter the correct habit ID")
+        try:
+            delete_habit_result(user_id, habit_id, cache)
+        except ActionError as error:
+            print(error)
+            return
+        print("Habit deleted successfully!")
     else:
         print("Invalid entry. The deletion is cancelled.")
 
-#Function to allow users to complete a habit
-def complete_habit_prompt(user_id):
-    #Get the user's habits
-    habits = get_habits_by_user(user_id)
-    if not habits:
-        print("You have no habits to complete.")
-        return
-    print("Your habits: ")
-    for habit in habits:
-        print(f"ID : {habit[0]} | Name: {habit[1]} | Periodicity: {habit[2]}")
-
-    #Prompt for habit ID to complete habit
-    habit_id = input("Please enter the ID of the habit you want to mark as complete: ")
-
-    if not habit_id.isdigit():
-        print("Invalid input. Please enter a number.")
-        return
-    
-    habit_id = int(habit_id)
-
-    #Make sure the habit belongs to the user
-    selected_habit = next((h for h in habits if h[0] == habit_id), None)
-    if not selected_habit:
-        print("Invalid habit ID. Please select a valid habit.")
-        return
-    
-    #Use the habit class (habit.py) to log the completion
-    habit = Habit(name = selected_habit[1], periodicity = selected_habit[2])
-    habit.check_off()
-
-    #Insert the completion into the database
-    insert_habit_completion(habit_id)
-
-    print(f"Habit '{habit.name}' marked as complete!")
+#Function to allow users to complete one or more habits
+#habit_ids can be given as a list of IDs (strings or numbers) or ["all"], otherwise the user is asked
+def complete_habit_prompt(user_id, habit_ids=None, cache=None):
+    if not habit_ids:
+        #Get the user's habits
+        habits = cache.get_habits_by_user() if cache else get_habits_by_user(user_id)
+        if not habits:
+            print("You have no habits to complete.")
+            return
+        write_lines(habit_lines([habit_record(habit) for habit in habits]))
 
-#Function to allow a user to select a habit and calculate a streak for it
-def view_habit_streak(user_id):
-    #Get the habits of the user
-    habits = get_habits_by_user(user_id)
+        #Prompt for habit IDs to complete (several IDs separated by commas, or 'all')
+        habit_ids = input("Please enter the ID of the habit you want to mark as complete (several IDs separated by commas, or 'all'): ")
+        habit_ids = habit_ids.replace(",", " ").split()
 
-    if not habits:
-        print("You have no habits to view.")
+    try:
+        result = complete_habits_result(user_id, habit_ids, cache)
+    except ActionError as error:
+        print(error)
         return
-    
-    print("Your habits: ")
-    for habit in habits:
-        print(f"ID : {habit[0]} | Name: {habit[1]} | Periodicity: {habit[2]}")
-
-    #Prompt for habit Id to view the streak
-    habit_id = input("Please enter the ID of the habit to view the streak for: ")
+    write_lines(f"Habit '{habit['name']}' marked as complete!" for habit in result["completed"])
 
+#Function to let the user select one of the habits of a streak result, returns None after invalid input
+def select_habit(habits, prompt):
+    write_lines(habit_lines(habits))
+    habit_id = input(prompt)
     if not habit_id.isdigit():
         print("Invalid input. Please enter a number.")
-        return
-    
-    habit_id = int(habit_id)
-
-    #Make sure the habit belongs to the user
-    selected_habit = next((h for h in habits if h[0] == habit_id), None)
+        return None
+    selected_habit = next((habit for habit in habits if habit["id"] == int(habit_id)), None)
     if not selected_habit:
         print("Invalid habit ID. Please select a valid habit ID.")
-        return
-    
-    #Get the habit completion history from the database
-    completions = get_completion_history_for_habit(habit_id)
-
-    #Create a habit object to calculate the streak
-    habit = Habit(name=selected_habit[1], periodicity=selected_habit[2])
-
-    #Add the completion history to the habit object
-    habit.completion_history = [completion[0] for completion in completions]
-
-    #Calculate and display the streak
-    habit.calculate_streak()
-
-#Function to calculate the longest streak for a specific habit
-def view_longest_streak(user_id):
-    #Get the habits of the user
-    habits = get_habits_by_user(user_id)
-
+    return selected_habit
+
+#Function to get the streak result of one habit, given or selected by the user (None after invalid input)
+def habit_streak(user_id, cache, since, until, habit_id, prompt):
+    try:
+        habits = habit_streaks_result(user_id, cache, since, until, habit_id)["habits"]
+    except ActionError as error:
+        print(error)
+        return None
     if not habits:
         print("You have no habits to view.")
-        return
-    
-    print("Your habits: ")
-    for habit in habits:
-        print(f"ID: {habit[0]}| Name: {habit[1]} | Periodicity: {habit[2]}")
-
-    #Prompt for habit ID to view the longest streak for that habit
-    habit_id = input("Please enter the ID of the habit you want to calculate the current streak for: ")
-
-    if not habit_id.isdigit():
-        print("Invalid input. Please enter a number.")
-        return
-    
-    habit_id = int(habit_id)
-
-    #Make sure the habit belongs to the user
-    selected_habit = next((h for h in habits if h[0] == habit_id), None)
-    if not selected_habit:
-        print("Invalid habit ID. Please select a valid habit.")
-        return
-    
-    #Get the completion history from the database
-    completions = get_completion_history_for_habit(habit_id)
-
-    #Create a habit object to calculate the longest streak for this habit
-    habit = Habit(name=selected_habit[1], periodicity=selected_habit[2])
-
-    #Add the completion history to the habit object and extract the completion dates from the result
-    habit.completion_history = [completion[0] for completion in completions]
-
-    #Calculate and display the longest streak
-    habit.calculate_streak()
-    print(f"The longest streak for '{habit.name}' is {habit.longest_streak} completions in a row.")
-
-#Function to allow a user to calculate the longest streak across all habits
-def view_longest_streak_across_all_habits(user_id):
-    #Get all habits of the user
-    habits = get_habits_by_user(user_id)
-
-    if not habits:
-        print("You have no habits to view.")
-        return
-    
-    #Track the overall longest streak
-    longest_streak = 0
-    #Track the habit with the longest streak
-    longest_streak_habit = None
-
-    print("Calculating the longest streak accross all you habits ...")
-
-    #Iteratre through all the habits and calculate their longest streaks
-    for habit in habits:
-        habit_id = habit[0]
-        habit_name = habit[1]
-        habit_periodicity = habit[2]
-
-        #Get the habit completion history from the database
-        completions = get_completion_history_for_habit(habit_id)
-
-        #Create a habit object
-        habit_object = Habit(name=habit_name, periodicity=habit_periodicity)
-
-        #Add the completion history to the object
-        habit_object.completion_history = [completion[0] for completion in completions]
-
-        #Calculate the streak for the current habit
-        habit_object.calculate_streak()
-
-        #Check if this habit's streak is the longest
-        if habit_object.longest_streak > longest_streak:
-            longest_streak = habit_object.longest_streak
-            longest_streak_habit = habit_object.name
-    
-    #Display the result
-    if longest_streak_habit:
-        print(f"The longest streak across all of your habits is {longest_streak} completions for the habit '{longest_streak_habit}'.")
+        return None
+    return habits[0] if habit_id is not None else select_habit(habits, prompt)
+
+#Function to allow a user to select a habit and view its streak (kept up to date by every completion)
+def view_habit_streak(user_id, cache=None, since=None, until=None, habit_id=None):
+    habit = habit_streak(user_id, cache, since, until, habit_id, "Please enter the ID of the habit to view the streak for: ")
+    if habit:
+        write_lines([f"Longest streak for '{habit['name']}': {habit['longest streak']} completions in a row.",
+                     f"Current Streak for '{habit['name']}': {habit['current streak']} completions in a row. "])
+
+#Function to view the longest streak for a specific habit
+def view_longest_streak(user_id, cache=None, since=None, until=None, habit_id=None):
+    habit = habit_streak(user_id, cache, since, until, habit_id,
+                         "Please enter the ID of the habit you want to calculate the current streak for: ")
+    if habit:
+        print(f"The longest streak for '{habit['name']}' is {habit['longest streak']} completions in a row.")
+
+#Function to allow a user to view the longest streak across all habits
+def view_longest_streak_across_all_habits(user_id, cache=None, since=None, until=None):
+    result = longest_streak_result(user_id, cache, since, until)
+    if result["habit"]:
+        print(f"The longest streak across all of your habits is {result['longest streak']} completions "
+              f"for the habit '{result['habit']['name']}'.")
     else:
         print("No streaks found for you habits. Complete a habit first.")
 
 #Function to display all habits belonging to a user
-def display_user_habits(user_id):
-    #Get all habits for the user
-    habits = get_habits_by_user(user_id)
-
+def display_user_habits(user_id, cache=None):
+    habits = user_habits_result(user_id, cache)["habits"]
     #Make sure there are habits
     if not habits:
         print("You have no habits to display.")
         return
-    
-    #Display the habits:
-    print("Your habits: ")
-    for habit in habits:
-        print(f"ID: {habit[0]}| Name: {habit[1]} | Periodicity: {habit[2]}")
-
-#Function to get the most challenging habit of a user
-def display_most_challenging_habit(user_id):
-    #Get the user's habits
-    habits = get_habits_by_user(user_id)
-
-    if not habits:
-        print("You have no habits do display.")
-        return
-    
-    most_challenging_habit = None
-    max_streak_break = 0
-
-    #Loop through the habits to calculate the streak breaks
-    for habit in habits:
-        habit_id, habit_name, periodicity = habit[:3]
-
-        #Get the completion history for the habit
-        completions = get_completion_history_for_habit(habit_id)
-        #Skips the habit if there are no completions
-        if not completions:
-            continue
-        
-        #Get the dates from the tuples that were returned
-        completion_dates = [completion[0] for completion in completions]
-        #Sort the dates in chronologica order
-        completion_dates.sort()
-
-        #Calculate the streak breaks
-        streak_breaks = 0
-        for i in range(1, len(completion_dates)):
-            #Get the two consecutive completion dates
-            current_date = completion_dates[i]
-            previous_date = completion_dates[i-1]
-
-            #Calculate the gap between consecutive completions
-            gap = (current_date - previous_date).days
-
-            #Check for streak breaks based on the periodicity
-            if periodicity == "daily" and gap > 1:
-                streak_breaks +=1
-            elif periodicity == "weekly" and gap >7:
-                streak_breaks +=1
-            elif periodicity == "monthly" and gap > 30:
-                streak_breaks +=1
-
-        #Track the most challenging habit
-        if streak_breaks > max_streak_break:
-            max_streak_break = streak_breaks
-            most_challenging_habit = habit
-
-    #Display the results
-    if most_challenging_habit:
-        print("Most challenging habit: ")
-        print(f"ID: {most_challenging_habit[0]}| Name: {most_challenging_habit[1]}| Periodicity: {most_challenging_habit[2]}")
-        print(f"Number of streak breaks: {max_streak_break}")
+    #Display the habits with their completion count and last completion
+    write_lines(["Your habits: "] + [f"ID: {habit['id']}| Name: {habit['name']} | Periodicity: {habit['periodicity']} | "
+                                     f"Completions: {habit['completions']} | Last completed: {habit['last completed'] or 'never'}"
+                                     for habit in habits])
+
+#Function to summarize the completions of the user's habits (habit ID -> analytics.summarize_ordered)
+#The completions of all habits are streamed in date order from one query, one habit at a time
+def habit_summaries(habits, cache=None, since=None, until=None):
+    periodicities = {habit[0]: habit[2] for habit in habits}
+    summaries = {habit_id: summarize_ordered(completion_dates, periodicities[habit_id])
+                 for habit_id, completion_dates in completion_groups(list(periodicities), cache, since, until)}
+    #Habits without completions
+    for habit_id, periodicity in periodicities.items():
+        if habit_id not in summaries:
+            summaries[habit_id] = summarize_ordered((), periodicity)
+    return summaries
+
+#Function to get the habits of the user with their summaries
+def user_habit_summaries(user_id, cache=None, since=None, until=None):
+    if cache:
+        habits = cache.get_habits_by_user()
+        return habits, habit_summaries(habits, cache, since, until)
+    def compute():
+        habits = get_habits_by_user(user_id)
+        return habits, habit_summaries(habits, since=since, until=until)
+    name = "habit summaries" if since is None and until is None else f"habit summaries {since} {until}"
+    return cached_result(user_id, name, compute)
+
+#Function to display the most challenging habit of a user
+def display_most_challenging_habit(user_id, cache=None, since=None, until=None):
+    result = most_challenging_habit_result(user_id, cache, since, until)
+    habit = result["habit"]
+    if habit:
+        write_lines(["Most challenging habit: ",
+                     f"ID: {habit['id']}| Name: {habit['name']}| Periodicity: {habit['periodicity']}",
+                     f"Number of streak breaks: {result['streak breaks']}"])
     else:
         print("No challenging habits were found. Good job!")
 
 #Function to group habits by periodicity
-def group_habits_by_periodicity(user_id):
-    print("Group Habits by Periodicity: ")
-    print("1. Daily Habits.")
-    print("2. Weekly Habits.")
-    print("3. Monthly Habits.")
-
-    group_choice = input("Which habits do you want to display? (1/2/3): ")
-
-    if group_choice == "1":
-        periodicity = "daily"
-    elif group_choice == "2":
-        periodicity = "weekly"
-    elif group_choice == "3":
-        periodicity = "monthly"
-    else:
-        print("Invalid input. Please enter 1, 2, or 3.")
-        return
-    
-    #Get the habits from database
-    habits = get_habits_by_periodicity(user_id, periodicity)
+def group_habits_by_periodicity(user_id, cache=None, periodicity=None):
+    if periodicity is None:
+        write_lines(["Group Habits by Periodicity: ", "1. Daily Habits.", "2. Weekly Habits.", "3. Monthly Habits."])
+        group_choice = input("Which habits do you want to display? (1/2/3): ")
+        if group_choice not in ("1", "2", "3"):
+            print("Invalid input. Please enter 1, 2, or 3.")
+            return
+        periodicity = PERIODICITIES[int(group_choice) - 1]
 
+    try:
+        habits = habit_groups_result(user_id, cache, periodicity)[periodicity]
+    except ActionError as error:
+        print(error)
+        return
     if habits:
-        for habit in habits:
-            print(f"ID: {habit[0]}| Name: {habit[1]}")
+        write_lines(f"ID: {habit['id']}| Name: {habit['name']} | Completions: {habit['completions']}" for habit in habits)
     else:
         print(f"No {periodicity} habits were found.")
 
-#Function to implement analytics.py
-def view_analytics(user_id):
-    #Get habit completion data from the database
-    habits = get_user_by_username(user_id)
-    if not habits: 
+#Function to display the analytics of analytics.py
+def view_analytics(user_id, cache=None, since=None, until=None):
+    result = analytics_result(user_id, cache, since, until)
+    if not result["average completion time"]:
         print("No habits available for analytics.")
         return
-    #Get data for analytics
-    habit_data = {}
-    for habit in habits:
-        habit_id, habit_name, _ = habit[:3]
-        completions = get_completion_history_for_habit(habit_id)
-        completion_dates = [completion[0] for completion in completions]
-        habit_data[habit_name] = completion_dates
-    #Perform analytics
-    avg_completion_times = {
-        habit: average_completion_time(dates) for habit, dates in habit_data.items()
-    }
-    consistent_habit = most_consistent_habit(habit_data)
-    streak_summary = aggregate_streak_analysis(
-        {habit: len(dates) for habit, dates in habit_data.items()}
-    )
-    #Display results
-    print("Habit Analytics: ")
-    print("-" * 30)
-    print("Average completion time in days: ")
-    for habit, avg_time in avg_completion_times.items():
-        print(f"{habit}: {avg_time:.2f}" if avg_time else f" {habit}: Not enough data.")
-    print(f"Most Consistent Habit: {consistent_habit}")
-    print(f"Aggregate Streaks: {streak_summary}")
+    lines = ["Habit Analytics: ", "-" * 30, "Average completion time in days: "]
+    for habit, avg_time in result["average completion time"].items():
+        lines.append(f"{habit}: {avg_time:.2f}" if avg_time else f" {habit}: Not enough data.")
+    lines.append(f"Most Consistent Habit: {result['most consistent habit']}")
+    lines.append(f"Aggregate Streaks: {result['aggregate streaks']}")
+    write_lines(lines)
+
+
+#Characters of the calendar heatmap for 0, 1, 2 and 3 or more completions on a day
+HEATMAP_LEVELS = ".+*#"
+
+#Function to draw a year as a heatmap: one row per weekday, one column per week
+def calendar_heatmap(day_counts, year):
+    first_day = date(year, 1, 1)
+    grid_start = first_day - timedelta(days=first_day.weekday())
+    weeks = (date(year, 12, 31) - grid_start).days // 7 + 1
+
+    #Month names above the week in which the month starts
+    header = [" "] * (weeks + 3)
+    for month in range(1, 13):
+        column = (date(year, month, 1) - grid_start).days // 7
+        header[column:column + 3] = calendar.month_abbr[month]
+    lines = ["    " + "".join(header).rstrip()]
+
+    for weekday in range(7):
+        cells = []
+        for week in range(weeks):
+            day = grid_start + timedelta(days=week * 7 + weekday)
+            cells.append(HEATMAP_LEVELS[min(day_counts.get(day, 0), 3)] if day.year == year else " ")
+        lines.append(f"{calendar.day_abbr[weekday]} " + "".join(cells))
+    lines.append(f"Legend: '{HEATMAP_LEVELS[0]}' none, '{HEATMAP_LEVELS[1]}' 1, '{HEATMAP_LEVELS[2]}' 2, '{HEATMAP_LEVELS[3]}' 3 or more completions")
+    return lines
+
+#Function to get the completions per day of all habits of the user in a year
+def user_day_counts(user_id, year, cache=None):
+    if cache:
+        return Counter(completed_at.date() for habit_id, *_ in cache.get_habits_by_user()
+                       for completed_at in cache.iter_completion_history(habit_id) if completed_at.year == year)
+    #At most one row per habit and day from the daily rollup table
+    def compute():
+        day_counts = Counter()
+        for _, day, completions in get_period_counts_by_user(user_id, "day", date(year, 1, 1), date(year, 12, 31)):
+            day_counts[day] += completions
+        return day_counts
+    return cached_result(user_id, f"day counts {year}", compute)
+
+#Function to display the completions of a year as a calendar heatmap
+def view_calendar(user_id, year=None, cache=None):
+    year = year or date.today().year
+    day_counts = user_day_counts(user_id, year, cache)
+    write_lines([f"Completions of all your habits in {year} ({sum(day_counts.values())} in total):",
+                 *calendar_heatmap(day_counts, year)])
+
+#Function to change the password of the logged in user (revokes the saved sessions)
+def change_password_prompt(user_id, current_password=None, new_password=None):
+    if current_password is None:
+        current_password = getpass.getpass("Please enter your current password: ")
+    if new_password is None:
+        new_password = getpass.getpass("Please enter your new password: ")
+    try:
+        change_password_result(user_id, current_password, new_password)
+    except ActionError as error:
+        print(error)
+        return
+    print("Password changed successfully! Please log in again with your new password.")
+
+#Function to describe a row of reminders.scan_broken_habits
+def broken_habit_record(row):
+    habit_id, user_id, habit_name, periodicity, last_completed_at, breaks_at, status = row
+    return {"id": habit_id, "name": habit_name, "user": user_id, "periodicity": periodicity,
+            "last completed": last_completed_at, "breaks at": breaks_at, "status": status}
+
+#Function to log in via argparse, with the password or with a session token
+#Returns the user ID, or None if the login failed
+def login_with_args(args):
+    try:
+        user_id, new_session = authenticate(args)
+    except ActionError as error:
+        print(error)
+        return None
+    if new_session:
+        write_lines([f"Login successful! Welcome, user {user_id}!",
+                     "Your session was saved. Further commands can use --login without a password."])
+    return user_id
 
 
 """
@@ -369,6 +573,32 @@ THE MAIN PROGRAM BEGINS HERE
 #Argparse is added here
 def parse_args():
     parser = argparse.ArgumentParser(description="HabitTracker CLI")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="text",
+                        help="Output format: text, or json for scripts (one JSON document, scan-broken writes one per line).")
+    #The commands also accept --format after their name
+    format_parser = argparse.ArgumentParser(add_help=False)
+    format_parser.add_argument("--format", choices=OUTPUT_FORMATS, default=argparse.SUPPRESS, help="Output format.")
+
+    #Commands for maintaining the application
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("migrate", parents=[format_parser], help="Create or upgrade the database tables.")
+    subparsers.add_parser("repair", parents=[format_parser], help="Recalculate the completion counts, last completions, streaks and rollup tables of all habits.")
+    subparsers.add_parser("check-plans", parents=[format_parser], help="Check that every query uses an index (no full table scans or filesorts).")
+    import_parser = subparsers.add_parser("import", parents=[format_parser], help="Import users, habits and completions from a CSV or JSONL file.")
+    import_parser.add_argument("file", help="File to import.")
+    import_parser.add_argument("--file_format", choices=FILE_FORMATS, help="File format (default: from the file extension).")
+    export_parser = subparsers.add_parser("export", parents=[format_parser], help="Export users, habits and completions to a CSV or JSONL file.")
+    export_parser.add_argument("file", help="File to write.")
+    export_parser.add_argument("--file_format", choices=FILE_FORMATS, help="File format (default: from the file extension).")
+    export_parser.add_argument("--users", nargs="+", metavar="USERNAME", help="Only export these users.")
+    report_parser = subparsers.add_parser("report", parents=[format_parser], help="Report the longest streaks, most challenging habits and broken streaks of all users.")
+    report_parser.add_argument("--workers", type=int, help="Number of worker processes (default: number of CPUs).")
+    report_parser.add_argument("--shards", type=int, help="Number of user ID ranges the users are split into.")
+    report_parser.add_argument("--top", type=int, default=REPORT_TOP_K, help="Length of the top lists.")
+    scan_parser = subparsers.add_parser("scan-broken", parents=[format_parser], help="List the habits of all users whose streak is broken or about to break.")
+    scan_parser.add_argument("--horizon_days", type=float, default=0,
+                             help="Also list streaks that break within this many days (default: only broken streaks).")
+    scan_parser.add_argument("--shards", type=int, default=SCAN_SHARDS, help="Number of user ID ranges the users are split into.")
 
     #Arguments for user actions that don't require login
     parser.add_argument("--create_account", action="store_true", help="Create a new account.")
@@ -377,7 +607,8 @@ def parse_args():
     #Arguments for actions that can be performed after login
     parser.add_argument("--create_habit", action="store_true", help="Create a new habit.")
     parser.add_argument("--delete_habit", action="store_true", help="Delete an existing habit.")
-    parser.add_argument("--complete_habit", action="store_true", help="Complete a habit.")
+    parser.add_argument("--complete_habit", nargs="*", metavar="HABIT_ID",
+                        help="Complete habits: a list of habit IDs, 'all', or no value to choose interactively.")
     parser.add_argument("--view_streak", action="store_true", help="View habit streak.")
     parser.add_argument("--view_longest_streak", action="store_true", help="View longest streak for a specific habit.")
     parser.add_argument("--view_all_streaks", action="store_true", help="View longest streak across all habits.")
@@ -385,65 +616,234 @@ def parse_args():
     parser.add_argument("--challenging_habit", action="store_true", help="Display the most challenging habit.")
     parser.add_argument("--group_habits", action="store_true", help="Group habits by periodicity.")
     parser.add_argument("--analytics", action="store_true", help="View habit analytics.")
+    parser.add_argument("--since", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="Only use completions from this day on for streaks and analytics.")
+    parser.add_argument("--until", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="Only use completions up to this day for streaks and analytics.")
+    parser.add_argument("--calendar", action="store_true", help="View the completions of a year as a calendar heatmap.")
+    parser.add_argument("--year", type=int, help="Year of the calendar (default: the current year).")
+    parser.add_argument("--habit_id", type=int, help="Habit of --delete_habit, --view_streak and --view_longest_streak (instead of asking).")
+    parser.add_argument("--habit_name", type=str, help="Name of the habit for --create_habit (instead of asking).")
+    parser.add_argument("--periodicity", choices=PERIODICITIES,
+                        help="Periodicity for --create_habit and --group_habits (instead of asking).")
 
     parser.add_argument("--username", type=str, help="Username for login.")
     parser.add_argument("--password", type=str, help="Password for login.")
+    parser.add_argument("--token", type=str, help="Session token for login instead of the password (default: the saved session).")
+    parser.add_argument("--logout", action="store_true", help="Log out and revoke the saved sessions.")
+    parser.add_argument("--change_password", action="store_true", help="Change the password, needs the current password (revokes the saved sessions).")
+    parser.add_argument("--new_password", type=str, help="New password for --change_password (instead of asking).")
+
+    parser.add_argument("--profile", action="store_true", help="Print the time spent per function when the command ends.")
+    parser.add_argument("--profile_file", type=str, help="Write the --profile breakdown as JSON to this file instead.")
 
     return parser.parse_args()
 
+#Name of the command for the --profile report
+def command_name(args):
+    if args.command:
+        return args.command
+    actions = ["create_account", "create_habit", "delete_habit", "complete_habit", "view_streak", "view_longest_streak",
+               "view_all_streaks", "display_habits", "challenging_habit", "group_habits", "analytics", "calendar", "change_password",
+               "logout", "login"]
+    return next((action for action in actions if getattr(args, action) not in (None, False)), "interactive")
+
+#Result of a command or of an action after --login for --format json
+def json_result(args):
+    if args.command == "migrate":
+        return {"applied versions": migrate()}
+    elif args.command == "repair":
+        rebuild_habit_completion_counts()
+        rebuild_habit_streaks()
+        rebuild_habit_rollups()
+        return {"repaired": True}
+    elif args.command == "check-plans":
+        return {"problems": check_query_plans()}
+    elif args.command in ("import", "export"):
+        rows, seconds = (import_data(args.file, args.file_format) if args.command == "import"
+                         else export_data(args.file, args.file_format, args.users))
+        return {"rows": rows, "seconds": seconds}
+    elif args.command == "report":
+        return report_result(run_report(args.workers, args.shards, args.top))
+    elif args.create_account:
+        return create_account_result(args.username, args.password)
+    elif args.logout:
+        revoke_sessions()
+        return {"logged out": True}
+    elif args.login:
+        user_id, _ = authenticate(args)
+        return user_action_result(args, user_id)
+    raise ActionError("--format json needs a command, --create_account, --logout or --login (the interactive menu only has text output).")
+
+#Result of the action after --login for --format json, the actions don't ask for input
+def user_action_result(args, user_id):
+    window = {"since": args.since, "until": args.until}
+    if args.create_habit:
+        return create_habit_result(user_id, args.habit_name, args.periodicity)
+    elif args.delete_habit:
+        if args.habit_id is None:
+            raise ActionError("--delete_habit needs --habit_id with --format json.")
+        return delete_habit_result(user_id, args.habit_id)
+    elif args.complete_habit is not None:
+        return complete_habits_result(user_id, args.complete_habit)
+    elif args.view_streak or args.view_longest_streak:
+        return habit_streaks_result(user_id, habit_id=args.habit_id, **window)
+    elif args.view_all_streaks:
+        return longest_streak_result(user_id, **window)
+    elif args.display_habits:
+        return user_habits_result(user_id)
+    elif args.challenging_habit:
+        return most_challenging_habit_result(user_id, **window)
+    elif args.group_habits:
+        return habit_groups_result(user_id, periodicity=args.periodicity)
+    elif args.analytics:
+        return analytics_result(user_id, **window)
+    elif args.calendar:
+        return calendar_result(user_id, args.year)
+    elif args.change_password:
+        if args.password is None or args.new_password is None:
+            raise ActionError("--change_password needs --password and --new_password with --format json.")
+        return change_password_result(user_id, args.password, args.new_password)
+    return {"user id": user_id}
+
+#Runs the command with --format json and returns the exit status
+def run_json(args):
+    #The scan is streamed: one JSON document per habit, written by one buffered call
+    if args.command == "scan-broken":
+        try:
+            sys.stdout.writelines(json.dumps(broken_habit_record(row), default=json_value) + "\n"
+                                  for row in scan_broken_habits(args.horizon_days, args.shards))
+        except SchemaVersionError as error:
+            write_json({"error": str(error)})
+            return 1
+        return 0
+    try:
+        result = json_result(args)
+    except (ActionError, SchemaVersionError) as error:
+        write_json({"error": str(error)})
+        return 1
+    write_json(result)
+    return 1 if result.get("problems") else 0
+
 #Main function for starting the app with argparse
 def main():
     args = parse_args()
 
-    #Creation of a new account
-    if args.create_account:
-        username_input = input("Please select your username: ")
-        password_input = getpass.getpass("Please select your password: ")
-        hashed_password = bcrypt.hashpw(password_input.encode('utf-8'), bcrypt.gensalt())
-        insert_new_user(username_input, hashed_password.decode('utf-8'))
+    #Per-function timings, printed (or written to a file) when the program exits
+    #With --format json the table goes to stderr, so stdout stays one JSON document
+    if args.profile or args.profile_file:
+        profiling.enable()
+        atexit.register(profiling.report, command_name(args), args.profile_file,
+                        sys.stderr if args.format == "json" else None)
+
+    if args.format == "json":
+        status = run_json(args)
+        if status:
+            sys.exit(status)
+
+    #Schema migration (the only command that changes the tables)
+    elif args.command == "migrate":
+        applied_versions = migrate()
+        if applied_versions:
+            print(f"Database migrated to schema version {applied_versions[-1]}.")
+        else:
+            print("The database schema is already up to date.")
+
+    #Recalculation of the values derived from the completion history (e.g. after editing the tables by hand)
+    elif args.command == "repair":
+        rebuild_habit_completion_counts()
+        rebuild_habit_streaks()
+        rebuild_habit_rollups()
+        print("Completion counts, streaks and rollup tables were recalculated.")
+
+    #Query plan check (exits with an error if a query needs a full table scan or a filesort)
+    elif args.command == "check-plans":
+        problems = check_query_plans()
+        if problems:
+            write_lines(problems)
+            sys.exit(1)
+        print("All queries use indexes.")
+
+    #Bulk import and export
+    elif args.command == "import":
+        rows, seconds = import_data(args.file, args.file_format)
+        print(f"Imported {rows} rows in {seconds:.2f} seconds ({rows / max(seconds, 1e-9):.0f} rows per second).")
+    elif args.command == "export":
+        rows, seconds = export_data(args.file, args.file_format, args.users)
+        print(f"Exported {rows} rows in {seconds:.2f} seconds ({rows / max(seconds, 1e-9):.0f} rows per second).")
+
+    #Report across all users, computed on a process pool
+    elif args.command == "report":
+        report = report_result(run_report(args.workers, args.shards, args.top))
+        write_lines([f"Report of {report['habits']} habits with {report['completions']} completions ({report['shards']} shards):",
+                     f"Broken streaks: {report['broken streaks']}",
+                     "Longest streaks: ",
+                     *(f"ID: {habit['id']}| Name: {habit['name']}| User: {habit['user']} | Longest streak: {habit['longest streak']}"
+                       for habit in report["longest streaks"]),
+                     "Most challenging habits: ",
+                     *(f"ID: {habit['id']}| Name: {habit['name']}| User: {habit['user']} | Streak breaks: {habit['streak breaks']}"
+                       for habit in report["most challenging habits"])])
+
+    #Broken and at-risk streaks of all users, written while they are streamed
+    elif args.command == "scan-broken":
+        found = 0
+        def scan_lines():
+            nonlocal found
+            for row in scan_broken_habits(args.horizon_days, args.shards):
+                habit = broken_habit_record(row)
+                found += 1
+                yield (f"ID: {habit['id']}| Name: {habit['name']}| User: {habit['user']} | Periodicity: {habit['periodicity']} | "
+                       f"Last completed: {habit['last completed']} | Breaks at: {habit['breaks at']} | {habit['status']}\n")
+        sys.stdout.writelines(scan_lines())
+        print(f"{found} habits found.")
+
+    #Creation of a new account (asks for the username and password if they are not given)
+    elif args.create_account:
+        username_input = args.username or input("Please select your username: ")
+        password_input = args.password or getpass.getpass("Please select your password: ")
+        try:
+            create_account_result(username_input, password_input)
+        except ActionError as error:
+            print(error)
+            return
         print("Account created successfully!")
     
+    #Logout revokes the saved sessions
+    elif args.logout:
+        revoke_sessions()
+        print("You are logged out.")
+
     #Login via argparse
     elif args.login:
-        if not args.username or not args.password:
-            print("Username and password are required for login.")
-            return
-    
-        user_data = get_user_by_username(args.username)
-        if user_data is None:
-            print("Username not found. Please try again or create an account.")
-            return
-        
-        stored_user_id, stored_hashed_password = user_data
-        if bcrypt.checkpw(args.password.encode('utf-8'), stored_hashed_password.encode('utf-8')):
-            print(f"Login successful! Welcome, user {stored_user_id}!")
-
-
+        stored_user_id = login_with_args(args)
+        if stored_user_id is not None:
             #After login: Check for actions
             if args.create_habit:
-                create_habit(stored_user_id)
+                create_habit(stored_user_id, habit_name=args.habit_name, periodicity=args.periodicity)
             elif args.delete_habit:
-                delete_habit_prompt(stored_user_id)
-            elif args.complete_habit:
-                complete_habit_prompt(stored_user_id)
+                delete_habit_prompt(stored_user_id, habit_id=args.habit_id)
+            elif args.complete_habit is not None:
+                complete_habit_prompt(stored_user_id, args.complete_habit)
             elif args.view_streak:
-                view_habit_streak(stored_user_id)
+                view_habit_streak(stored_user_id, since=args.since, until=args.until, habit_id=args.habit_id)
             elif args.view_longest_streak:
-                view_longest_streak(stored_user_id)
+                view_longest_streak(stored_user_id, since=args.since, until=args.until, habit_id=args.habit_id)
             elif args.view_all_streaks:
-                view_longest_streak_across_all_habits(stored_user_id)
+                view_longest_streak_across_all_habits(stored_user_id, since=args.since, until=args.until)
             elif args.display_habits:
                 display_user_habits(stored_user_id)
             elif args.challenging_habit:
-                display_most_challenging_habit(stored_user_id)
+                display_most_challenging_habit(stored_user_id, since=args.since, until=args.until)
             elif args.group_habits:
-                group_habits_by_periodicity(stored_user_id)
+                group_habits_by_periodicity(stored_user_id, periodicity=args.periodicity)
             elif args.analytics:
-                view_analytics(stored_user_id)
+                view_analytics(stored_user_id, since=args.since, until=args.until)
+            elif args.calendar:
+                view_calendar(stored_user_id, args.year)
+            elif args.change_password:
+                change_password_prompt(stored_user_id, args.password, args.new_password)
             else:
                 print("Invalid action. Please specify a valid argument.")
-        else:
-            print("Incorrect password. Please try again.")
 
     #If no arguments are provided, use an interactive menu
     else:
@@ -455,7 +855,7 @@ def main():
         if choice == "1":
             username_input = input("Please select your username: ")
             password_input = getpass.getpass("Please select your password: ")
-            hashed_password = bcrypt.hashpw(password_input.encode('utf-8'), bcrypt.gensalt())
+            hashed_password = hashpw(password_input.encode('utf-8'), bcrypt.gensalt())
             insert_new_user(username_input, hashed_password.decode('utf-8'))
             print("Account created successfully!")
 
@@ -468,8 +868,10 @@ def main():
                 return
             
             stored_user_id, stored_hashed_password = user_data
-            if bcrypt.checkpw(entry_password.encode('utf-8'), stored_hashed_password.encode('utf-8')):
+            if checkpw(entry_password.encode('utf-8'), stored_hashed_password.encode('utf-8')):
                 print(f"Login successful! Welcome, user {stored_user_id}!")
+                #Habits and completions are loaded once for the whole session
+                cache = HabitCache(stored_user_id)
 
                 # After login  show the action menu
                 while stored_user_id:
@@ -484,30 +886,33 @@ def main():
                     print("8. Display the Most Challenging Habit.")
                     print("9. Group Habits by Periodicity.")
                     print("10. View Analytics.")
-                    print("11. Logout.")
+                    print("11. View Calendar.")
+                    print("12. Logout.")
                     action = input("What would you like to do?: ")
 
                     if action == "1":
-                        create_habit(stored_user_id)
+                        create_habit(stored_user_id, cache=cache)
                     elif action == "2":
-                        delete_habit_prompt(stored_user_id)
+                        delete_habit_prompt(stored_user_id, cache=cache)
                     elif action == "3":
-                        complete_habit_prompt(stored_user_id)
+                        complete_habit_prompt(stored_user_id, cache=cache)
                     elif action == "4":
-                        view_habit_streak(stored_user_id)
+                        view_habit_streak(stored_user_id, cache=cache)
                     elif action == "5":
-                        view_longest_streak(stored_user_id)
+                        view_longest_streak(stored_user_id, cache=cache)
                     elif action == "6":
-                        view_longest_streak_across_all_habits(stored_user_id)
+                        view_longest_streak_across_all_habits(stored_user_id, cache=cache)
                     elif action == "7":
-                        display_user_habits(stored_user_id)
+                        display_user_habits(stored_user_id, cache=cache)
                     elif action == "8":
-                        display_most_challenging_habit(stored_user_id)
+                        display_most_challenging_habit(stored_user_id, cache=cache)
                     elif action == "9":
-                        group_habits_by_periodicity(stored_user_id)
+                        group_habits_by_periodicity(stored_user_id, cache=cache)
                     elif action == "10":
-                        view_analytics(stored_user_id)
+                        view_analytics(stored_user_id, cache=cache)
                     elif action == "11":
+                        view_calendar(stored_user_id, cache=cache)
+                    elif action == "12":
                         print("Goodbye!")
                         break
                     else:
@@ -516,4 +921,7 @@ def main():
                 print("Incorrect password. Please try again.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    except SchemaVersionError as error:
+        print(error)
\ No newline at end of file
@@ -1,129 +1,1207 @@
+#Thread-safe connection handling
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import groupby
 #Connection to MySQL
 import mysql.connector
+from mysql.connector import errorcode
 #Used for password hashing
 import bcrypt
+#Streak rules for the stored streak state
+from habit import Habit, streak_from_counts
+#Call counts, rows and timings for --profile
+from profiling import instrument_methods
 
-#Creation of a new database
-db = mysql.connector.connect(
-    host = "localhost",
-    user = "root",
-    passwd = "testingpassword",
-    database = "habittrackerdb"
-    #database = "testdatabase" #Uncomment this for pytest tests, use "habittrackerdb" for real use
-)
-
-mycursor = db.cursor()
-
-
-#Creation of User table
-mycursor.execute(""" CREATE TABLE IF NOT EXISTS Users(
-                 username VARCHAR(50) NOT NULL,
-                 password VARCHAR(500) NOT NULL,
-                 userID INT(15) AUTO_INCREMENT PRIMARY KEY,
-                 UNIQUE (username)
-                 )
-                 """)
-db.commit()
-
-#Creation of Habit table
-mycursor.execute(""" CREATE TABLE IF NOT EXISTS Habits(
-                 habitID INT(15) AUTO_INCREMENT PRIMARY KEY,
-                 habitname VARCHAR(100) NOT NULL,
-                 periodicity ENUM('daily', 'weekly', 'monthly') NOT NULL,
-                 created_at DATETIME NOT NULL,
-                 userrefID  INT(15),
-                 FOREIGN KEY(userrefID) REFERENCES Users(userID) ON DELETE CASCADE
-                 )
-                 """)
-db.commit()
-
-#Creation of CompletionHistory table
-mycursor.execute(""" CREATE TABLE IF NOT EXISTS CompletionHistory(
-                 completionhistoryID INT(15) AUTO_INCREMENT PRIMARY KEY,
-                 habitrefID INT(15),
-                 completedate DATETIME NOT NULL,
-                 FOREIGN KEY(habitrefID) REFERENCES Habits(habitID) ON DELETE CASCADE
-                 )
-                 """)
-db.commit()
-
-#New user account creation
-def insert_new_user(username_input, hashed_password):
-    #INSERT query to store the hashed password and username in the users table
-    mycursor.execute("""INSERT INTO Users(username, password)
-                    VALUES (%s, %s)
-                    """, (username_input, hashed_password))
-    db.commit()
+#Connection settings of the database
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "passwd": "testingpassword",
+    "database": "habittrackerdb",
+    #"database": "testdatabase", #Use this for pytest tests, use "habittrackerdb" for real use
+}
+
+#Maximum number of connections that are open at the same time
+POOL_SIZE = 5
+#Idle connections older than this (in seconds) are pinged and reconnected before they are used
+STALE_AFTER_SECONDS = 60
+#Number of rows fetched at a time by streaming queries
+STREAM_BATCH_SIZE = 1000
+
+#Engine that recalculates streaks from the completion history: "python" (Habit rules in Python)
+#or "sql" (window functions in the database, needs MySQL 8) or "rollup" (completion counts per day and month)
+STREAK_ENGINE = "python"
+
+#Schema version this code expects, must match the last entry of MIGRATIONS
+SCHEMA_VERSION = 8
+
+#Migration step that adds a column unless it already exists. MySQL commits ALTER TABLE at once, so if a
+#later step of the version fails (e.g. a backfill), the column stays but the version is not recorded
+def add_column(table, column, definition):
+    def step(cursor):
+        cursor.execute(""" SELECT COUNT(*) FROM information_schema.COLUMNS
+                       WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+                       """, (table, column))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+#Versioned schema changes, applied in order by migrate() ("python cli.py migrate")
+MIGRATIONS = [
+    (1, [
+        #Creation of User table
+        """ CREATE TABLE IF NOT EXISTS Users(
+            username VARCHAR(50) NOT NULL,
+            password VARCHAR(500) NOT NULL,
+            userID INT(15) AUTO_INCREMENT PRIMARY KEY,
+            UNIQUE (username)
+            )
+        """,
+        #Creation of Habit table
+        """ CREATE TABLE IF NOT EXISTS Habits(
+            habitID INT(15) AUTO_INCREMENT PRIMARY KEY,
+            habitname VARCHAR(100) NOT NULL,
+            periodicity ENUM('daily', 'weekly', 'monthly') NOT NULL,
+            created_at DATETIME NOT NULL,
+            userrefID  INT(15),
+            FOREIGN KEY(userrefID) REFERENCES Users(userID) ON DELETE CASCADE
+            )
+        """,
+        #Creation of CompletionHistory table
+        """ CREATE TABLE IF NOT EXISTS CompletionHistory(
+            completionhistoryID INT(15) AUTO_INCREMENT PRIMARY KEY,
+            habitrefID INT(15),
+            completedate DATETIME NOT NULL,
+            FOREIGN KEY(habitrefID) REFERENCES Habits(habitID) ON DELETE CASCADE
+            )
+        """,
+    ]),
+    (2, [
+        #Completion history of a habit in date order is read by an index range scan
+        "CREATE INDEX idx_completion_habit_date ON CompletionHistory(habitrefID, completedate)",
+        #Habits of a user, optionally filtered by periodicity
+        "CREATE INDEX idx_habits_user_periodicity ON Habits(userrefID, periodicity)",
+    ]),
+    (3, [
+        #Stored streak state, updated by every check-off
+        add_column("Habits", "current_streak", "INT NOT NULL DEFAULT 0"),
+        add_column("Habits", "longest_streak", "INT NOT NULL DEFAULT 0"),
+        add_column("Habits", "last_completed_at", "DATETIME NULL"),
+        #Fill the streak state from the existing completion history (the rollup tables of the
+        #"rollup" engine don't exist yet at this version)
+        lambda cursor: rebuild_streaks(cursor, engine="python"),
+    ]),
+    (4, [
+        #Version of the user's data, increased by every change so that cached results can be reused (see result_cache.py)
+        add_column("Users", "data_version", "INT NOT NULL DEFAULT 0"),
+    ]),
+    (5, [
+        #Random ID of this database, so that cached results (see result_cache.py) are never shared between
+        #databases, also not with a database that is recreated under the same name
+        "CREATE TABLE IF NOT EXISTS DatabaseInfo(database_id CHAR(32) NOT NULL PRIMARY KEY)",
+        "INSERT INTO DatabaseInfo(database_id) VALUES (REPLACE(UUID(), '-', ''))",
+    ]),
+    (6, [
+        #Rollup tables: number of completions per habit and day, ISO week (starting on Monday) and month
+        """ CREATE TABLE IF NOT EXISTS CompletionDaily(
+            habitrefID INT(15) NOT NULL,
+            period_start DATE NOT NULL,
+            completions INT NOT NULL,
+            PRIMARY KEY (habitrefID, period_start),
+            FOREIGN KEY(habitrefID) REFERENCES Habits(habitID) ON DELETE CASCADE
+            )
+        """,
+        """ CREATE TABLE IF NOT EXISTS CompletionWeekly(
+            habitrefID INT(15) NOT NULL,
+            period_start DATE NOT NULL,
+            completions INT NOT NULL,
+            PRIMARY KEY (habitrefID, period_start),
+            FOREIGN KEY(habitrefID) REFERENCES Habits(habitID) ON DELETE CASCADE
+            )
+        """,
+        """ CREATE TABLE IF NOT EXISTS CompletionMonthly(
+            habitrefID INT(15) NOT NULL,
+            period_start DATE NOT NULL,
+            completions INT NOT NULL,
+            PRIMARY KEY (habitrefID, period_start),
+            FOREIGN KEY(habitrefID) REFERENCES Habits(habitID) ON DELETE CASCADE
+            )
+        """,
+        #Fill the rollup tables from the existing completion history
+        lambda cursor: rebuild_rollups(cursor),
+    ]),
+    (7, [
+        #The broken streak scan filters a user range on periodicity and last completion in the index,
+        #the new index also serves the habits of a user (and their foreign key), so it replaces the old one
+        """ ALTER TABLE Habits
+            ADD INDEX idx_habits_user_periodicity_last (userrefID, periodicity, last_completed_at),
+            DROP INDEX idx_habits_user_periodicity
+        """,
+    ]),
+    (8, [
+        #Number of completions of a habit, updated with every completion so that lists don't read the history
+        add_column("Habits", "completion_count", "INT NOT NULL DEFAULT 0"),
+        #Fill the completion counts (and last completions) from the existing completion history
+        lambda cursor: rebuild_completion_counts(cursor),
+    ]),
+]
+
+#Raised when the database schema does not match SCHEMA_VERSION
+class SchemaVersionError(Exception):
+    pass
+
+#Returns the recorded schema version (0 if the database was never migrated)
+def get_schema_version(cursor):
+    try:
+        cursor.execute("SELECT MAX(version) FROM SchemaVersion")
+    except mysql.connector.ProgrammingError as error:
+        if error.errno == errorcode.ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    version = cursor.fetchone()[0]
+    return version or 0
+
+
+#Condition on the habit IDs for the streak engines (all habits if habit_ids is None)
+def _habit_condition(habit_ids, column):
+    if habit_ids is None:
+        return "", ()
+    placeholders = ", ".join(["%s"] * len(habit_ids))
+    return f"WHERE {column} IN ({placeholders})", tuple(habit_ids)
+
+#Python streak engine: one pass over the completions in index order with Habit.advance_streak
+#Returns habit ID -> (current streak, longest streak, last completion)
+def python_streaks(cursor, habit_ids=None):
+    condition, params = _habit_condition(habit_ids, "habitID")
+    cursor.execute(f"SELECT habitID, periodicity FROM Habits {condition}", params)
+    habits = {habit_id: Habit(name=habit_id, periodicity=periodicity) for habit_id, periodicity in cursor.fetchall()}
+
+    condition, params = _habit_condition(habit_ids, "habitrefID")
+    cursor.execute(f"""
+                   SELECT habitrefID, completedate FROM CompletionHistory
+                   {condition}
+                   ORDER BY habitrefID, completedate
+                   """, params)
+    for habit_id, completedate in cursor:
+        habits[habit_id].advance_streak(completedate)
+    return {habit_id: (habit.streak, habit.longest_streak, habit.last_completed) for habit_id, habit in habits.items()}
+
+#SQL streak engine: gaps and islands with window functions (MySQL 8), same rules as Habit.is_continuous
+#A completion starts a new island (streak) unless it continues the previous completion of the habit
+def sql_streaks(cursor, habit_ids=None):
+    condition, params = _habit_condition(habit_ids, "habitID")
+    cursor.execute(f"SELECT habitID FROM Habits {condition}", params)
+    streaks = {row[0]: (0, 0, None) for row in cursor.fetchall()}
+
+    condition, params = _habit_condition(habit_ids, "c.habitrefID")
+    cursor.execute(f"""
+                   WITH ordered AS (
+                       SELECT c.habitrefID, c.completionhistoryID, c.completedate, h.periodicity,
+                              LAG(c.completedate) OVER (PARTITION BY c.habitrefID
+                                                        ORDER BY c.completedate, c.completionhistoryID) AS previous_date
+                       FROM CompletionHistory c
+                       JOIN Habits h ON h.habitID = c.habitrefID
+                       {condition}
+                   ),
+                   flagged AS (
+                       SELECT habitrefID, completionhistoryID, completedate,
+                              CASE
+                                  WHEN previous_date IS NULL THEN 1
+                                  WHEN periodicity = 'daily'
+                                       AND DATE(completedate) = DATE(previous_date) + INTERVAL 1 DAY THEN 0
+                                  WHEN periodicity = 'weekly'
+                                       AND WEEKDAY(completedate) = WEEKDAY(previous_date)
+                                       AND TIMESTAMPDIFF(DAY, previous_date, completedate) <= 7 THEN 0
+                                  WHEN periodicity = 'monthly'
+                                       AND YEAR(completedate) = YEAR(previous_date)
+                                       AND MONTH(completedate) = MONTH(previous_date) THEN 0
+                                  ELSE 1
+                              END AS starts_streak
+                       FROM ordered
+                   ),
+                   islands AS (
+                       SELECT habitrefID, completedate,
+                              SUM(starts_streak) OVER (PARTITION BY habitrefID
+                                                       ORDER BY completedate, completionhistoryID
+                                                       ROWS UNBOUNDED PRECEDING) AS island
+                       FROM flagged
+                   ),
+                   runs AS (
+                       SELECT habitrefID, island, COUNT(*) AS streak_length, MAX(completedate) AS last_completed,
+                              MAX(island) OVER (PARTITION BY habitrefID) AS last_island
+                       FROM islands
+                       GROUP BY habitrefID, island
+                   )
+                   SELECT habitrefID,
+                          MAX(CASE WHEN island = last_island THEN streak_length END) AS current_streak,
+                          MAX(streak_length) AS longest_streak,
+                          MAX(last_completed) AS last_completed
+                   FROM runs
+                   GROUP BY habitrefID
+                   """, params)
+    for habit_id, current_streak, longest_streak, last_completed in cursor.fetchall():
+        streaks[habit_id] = (int(current_streak), int(longest_streak), last_completed)
+    return streaks
+
+#Rollup tables by period, every table has the columns habitrefID, period_start (first day of the period) and completions
+ROLLUP_TABLES = {"day": "CompletionDaily", "week": "CompletionWeekly", "month": "CompletionMonthly"}
+
+#First day of the day, ISO week and month of a completion
+def rollup_periods(completed_at):
+    day = completed_at.date()
+    return {"day": day, "week": day - timedelta(days=day.weekday()), "month": day.replace(day=1)}
+
+#Adds completions (habit ID, completion date) to the rollup tables, one row per habit and period
+#The rows are written in key order, so concurrent completions of the same habits lock them in the same
+#order and can't deadlock
+def add_to_rollups(cursor, completions):
+    counts = {period: Counter() for period in ROLLUP_TABLES}
+    for habit_id, completed_at in completions:
+        for period, period_start in rollup_periods(completed_at).items():
+            counts[period][(habit_id, period_start)] += 1
+    for period, table in ROLLUP_TABLES.items():
+        cursor.executemany(f"""
+                           INSERT INTO {table}(habitrefID, period_start, completions) VALUES (%s, %s, %s)
+                           ON DUPLICATE KEY UPDATE completions = completions + VALUES(completions)
+                           """, [(habit_id, period_start, count) for (habit_id, period_start), count in sorted(counts[period].items())])
+
+#Recalculates the rollup tables of the given habits (all habits if None) from their completion history
+def rebuild_rollups(cursor, habit_ids=None):
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        if not habit_ids:
+            return
+    condition, params = _habit_condition(habit_ids, "habitrefID")
+    for table in ROLLUP_TABLES.values():
+        cursor.execute(f"DELETE FROM {table} {condition}", params)
+    cursor.execute(f"""
+                   INSERT INTO CompletionDaily(habitrefID, period_start, completions)
+                   SELECT habitrefID, DATE(completedate), COUNT(*) FROM CompletionHistory
+                   {condition}
+                   GROUP BY habitrefID, DATE(completedate)
+                   """, params)
+    #Weeks and months are summed from the days
+    cursor.execute(f"""
+                   INSERT INTO CompletionWeekly(habitrefID, period_start, completions)
+                   SELECT habitrefID, period_start - INTERVAL WEEKDAY(period_start) DAY AS week_start, SUM(completions)
+                   FROM CompletionDaily
+                   {condition}
+                   GROUP BY habitrefID, week_start
+                   """, params)
+    cursor.execute(f"""
+                   INSERT INTO CompletionMonthly(habitrefID, period_start, completions)
+                   SELECT habitrefID, period_start - INTERVAL (DAYOFMONTH(period_start) - 1) DAY AS month_start, SUM(completions)
+                   FROM CompletionDaily
+                   {condition}
+                   GROUP BY habitrefID, month_start
+                   """, params)
+
+#Rollup streak engine: the streak rules applied to completion counts per day (daily and weekly habits)
+#or per month (monthly habits), which gives the same streaks as the other engines from far fewer rows
+def rollup_streaks(cursor, habit_ids=None):
+    condition, params = _habit_condition(habit_ids, "habitID")
+    cursor.execute(f"SELECT habitID, periodicity FROM Habits {condition}", params)
+    periodicities = dict(cursor.fetchall())
+    streaks = {habit_id: (0, 0) for habit_id in periodicities}
+
+    for period in ["day", "month"]:
+        period_habit_ids = [habit_id for habit_id, periodicity in periodicities.items()
+                            if (periodicity == "monthly") == (period == "month")]
+        if not period_habit_ids:
+            continue
+        condition, params = _habit_condition(period_habit_ids, "habitrefID")
+        cursor.execute(f"""
+                       SELECT habitrefID, period_start, completions FROM {ROLLUP_TABLES[period]}
+                       {condition}
+                       ORDER BY habitrefID, period_start
+                       """, params)
+        for habit_id, rows in groupby(cursor.fetchall(), key=lambda row: row[0]):
+            streaks[habit_id] = streak_from_counts(periodicities[habit_id], (row[1:] for row in rows))
+
+    #The time of the last completion is read from the completion history index
+    condition, params = _habit_condition(habit_ids, "habitrefID")
+    cursor.execute(f"SELECT habitrefID, MAX(completedate) FROM CompletionHistory {condition} GROUP BY habitrefID", params)
+    last_completed = dict(cursor.fetchall())
+    return {habit_id: (*streak, last_completed.get(habit_id)) for habit_id, streak in streaks.items()}
+
+STREAK_ENGINES = {"python": python_streaks, "sql": sql_streaks, "rollup": rollup_streaks}
+
+#Recalculates the stored streak state of the given habits (all habits if None) from their completion history
+def rebuild_streaks(cursor, habit_ids=None, engine=None):
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        if not habit_ids:
+            return
+    streaks = STREAK_ENGINES[engine or STREAK_ENGINE](cursor, habit_ids)
+    cursor.executemany("""
+                       UPDATE Habits SET current_streak = %s, longest_streak = %s, last_completed_at = %s
+                       WHERE habitID = %s
+                       """, [(*state, habit_id) for habit_id, state in streaks.items()])
+
+#Recalculates the completion count and the last completion of the given habits (all habits if None)
+#from their completion history, both are read from the (habitrefID, completedate) index
+def rebuild_completion_counts(cursor, habit_ids=None):
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        if not habit_ids:
+            return
+    condition, params = _habit_condition(habit_ids, "h.habitID")
+    cursor.execute(f"""
+                   UPDATE Habits h
+                   SET h.completion_count = (SELECT COUNT(*) FROM CompletionHistory c WHERE c.habitrefID = h.habitID),
+                       h.last_completed_at = (SELECT MAX(c.completedate) FROM CompletionHistory c WHERE c.habitrefID = h.habitID)
+                   {condition}
+                   """, params)
+
+
+#Bounded pool of MySQL connections that can be shared between threads
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, stale_after=STALE_AFTER_SECONDS, **config):
+        self.size = size
+        self.stale_after = stale_after
+        self._config = config
+        #Limits the number of borrowed connections, callers wait when all are in use
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = [] #(connection, time it was returned)
+        self._closed = False
+
+    #Borrow a connection (blocks while all connections are in use)
+    def acquire(self, timeout=None):
+        if self._closed:
+            raise mysql.connector.errors.PoolError("The connection pool is closed.")
+        if not self._slots.acquire(timeout=timeout):
+            raise mysql.connector.errors.PoolError("No connection available in the pool.")
+        try:
+            with self._lock:
+                idle = self._idle.pop() if self._idle else None
+            if idle is None:
+                return mysql.connector.connect(**self._config)
+            connection, released_at = idle
+            #Reconnect connections that may have been dropped by the server while idle
+            if time.monotonic() - released_at > self.stale_after:
+                connection.ping(reconnect=True, attempts=3, delay=1)
+            return connection
+        except Exception:
+            self._slots.release()
+            raise
+
+    #Return a borrowed connection, broken connections are closed instead of reused
+    def release(self, connection, discard=False):
+        try:
+            if discard or self._closed:
+                self._close_quietly(connection)
+            else:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard)
+
+    #Close all idle connections, connections in use are closed when they are returned
+    def close(self):
+        self._closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+
+#Increase the data version of users (by user ID, of the owners of some habits, or of all users), which marks their cached results as outdated
+def bump_data_versions(cursor, user_ids=(), habit_ids=(), all_users=False):
+    if all_users:
+        cursor.execute("UPDATE Users SET data_version = data_version + 1")
+        return
+    if user_ids:
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cursor.execute(f"UPDATE Users SET data_version = data_version + 1 WHERE userID IN ({placeholders})", tuple(user_ids))
+    if habit_ids:
+        #A multiple-table update changes every user once, however many of their habits are listed
+        placeholders = ", ".join(["%s"] * len(habit_ids))
+        cursor.execute(f"""
+                       UPDATE Users u JOIN Habits h ON h.userrefID = u.userID
+                       SET u.data_version = u.data_version + 1
+                       WHERE h.habitID IN ({placeholders})
+                       """, tuple(habit_ids))
+
+
+#Data-access object: every call borrows its own connection and cursor from the pool
+@instrument_methods("database", count_rows=True, exclude=("cursor", "stream", "close"))
+class HabitDatabase:
+    def __init__(self, pool):
+        self.pool = pool
+        self._database_id = None #Read by the first get_database_id()
+
+    #Cursor for one unit of work, committed at the end or rolled back on errors
+    @contextmanager
+    def cursor(self):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                yield cursor
+                connection.commit()
+            except Exception:
+                try:
+                    connection.rollback()
+                except mysql.connector.Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
+    #Rows of a query streamed from an unbuffered cursor in batches, so memory stays flat
+    def stream(self, statement, params=(), batch_size=STREAM_BATCH_SIZE):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(buffered=False)
+            try:
+                cursor.execute(statement, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                #Discard rows that were not read because the caller stopped early
+                connection.consume_results()
+                cursor.close()
+                connection.rollback()
+
+    def close(self):
+        self.pool.close()
+
+    #Make sure the tables were migrated to the version this code expects
+    def check_schema_version(self):
+        with self.cursor() as cursor:
+            version = get_schema_version(cursor)
+        if version != SCHEMA_VERSION:
+            raise SchemaVersionError(
+                f"Database schema is at version {version}, expected {SCHEMA_VERSION}. "
+                "Please run 'python cli.py migrate' first.")
+
+    #Applies all pending migrations and records the new schema version
+    def migrate(self):
+        applied = []
+        #Each version is committed on its own, so the connection is used directly instead of self.cursor()
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(""" CREATE TABLE IF NOT EXISTS SchemaVersion(
+                               version INT PRIMARY KEY,
+                               applied_at DATETIME NOT NULL
+                               )
+                               """)
+                current_version = get_schema_version(cursor)
+                for version, statements in MIGRATIONS:
+                    if version <= current_version:
+                        continue
+                    for statement in statements:
+                        #Data migrations are functions that receive the cursor
+                        if callable(statement):
+                            statement(cursor)
+                        else:
+                            cursor.execute(statement)
+                    cursor.execute("INSERT INTO SchemaVersion(version, applied_at) VALUES (%s, NOW())", (version,))
+                    connection.commit()
+                    applied.append(version)
+            except Exception:
+                try:
+                    connection.rollback()
+                except mysql.connector.Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+        return applied #Returns the versions that were applied
+
+    #New user account creation
+    def insert_new_user(self, username_input, hashed_password):
+        #INSERT query to store the hashed password and username in the users table
+        with self.cursor() as cursor:
+            cursor.execute("""INSERT INTO Users(username, password)
+                        VALUES (%s, %s)
+                        """, (username_input, hashed_password))
+
+    #Allow users to log in
+    def get_user_by_username(self, entry_username):
+        #App retrieves stored password
+        with self.cursor() as cursor:
+            cursor.execute(""" SELECT userID, password FROM users WHERE username = %s
+                         """, (entry_username,))
+            return cursor.fetchone() #Fetch one row from the result of the query
+
+    #Stored password hash of a user (None if the user doesn't exist), checked before the password is changed
+    def get_user_password(self, user_id):
+        with self.cursor() as cursor:
+            cursor.execute("SELECT password FROM Users WHERE userID = %s", (user_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    #Allow users to change their password
+    def update_user_password(self, user_id, hashed_password):
+        with self.cursor() as cursor:
+            cursor.execute("UPDATE Users SET password = %s WHERE userID = %s", (hashed_password, user_id))
+            return cursor.rowcount > 0
+
+    #Allow logged in users to create a new habit
+    def insert_new_habit(self, habit_name, periodicity, user_id):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        INSERT INTO habits(habitname, periodicity, created_at, userrefID)
+                         VALUES(%s, %s, NOW(), %s)
+                         """, (habit_name, periodicity, user_id))
+            habit_id = cursor.lastrowid
+            bump_data_versions(cursor, user_ids=[user_id])
+            return habit_id #Returns the ID of the new habit
+
+    #Allow logged in users to delete a habit
+    def delete_habit(self, habit_id, user_id):
+        #Make sure the habit belongs to the logged in user
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        DELETE FROM habits
+                        WHERE habitID = %s AND userrefID = %s
+                         """, (habit_id, user_id))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                bump_data_versions(cursor, user_ids=[user_id])
+            return deleted
+
+    #Display habits for deleting
+    def display_habits_for_deletion(self, user_id):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        SELECT habitID, habitname, periodicity FROM habits
+                        WHERE userrefID = %s
+                         """, (user_id,))
+            return cursor.fetchall() #Return the list of habits for the user
+
+    #Allow users to complete a habit
+    def insert_habit_completion(self, habit_id, completed_at=None):
+        self.insert_habit_completions([habit_id], completed_at)
+
+    #Complete several habits at once: one multi-row insert and one commit
+    def insert_habit_completions(self, habit_ids, completed_at=None):
+        habit_ids = sorted(set(habit_ids)) #Each habit is completed once, rows are locked in habit ID order
+        if not habit_ids:
+            return
+        #DATETIME columns store whole seconds
+        completed_at = completed_at or datetime.now().replace(microsecond=0)
+        placeholders = ", ".join(["%s"] * len(habit_ids))
+        with self.cursor() as cursor:
+            #The habit rows are locked first, so concurrent completions of the same habits wait here instead of
+            #deadlocking on the locks of the inserts below (the foreign key checks share-lock the habits)
+            cursor.execute(f"""
+                        SELECT habitID, periodicity, current_streak, longest_streak, last_completed_at FROM Habits
+                        WHERE habitID IN ({placeholders}) ORDER BY habitID FOR UPDATE
+                         """, tuple(habit_ids))
+            streak_states = cursor.fetchall()
+            #Insert the completion records in the completionhistory table
+            cursor.executemany("""
+                        INSERT INTO CompletionHistory(habitrefID, completedate)
+                         VALUES (%s, %s)
+                         """, [(habit_id, completed_at) for habit_id in habit_ids])
+            add_to_rollups(cursor, [(habit_id, completed_at) for habit_id in habit_ids])
+            cursor.execute(f"UPDATE Habits SET completion_count = completion_count + 1 WHERE habitID IN ({placeholders})",
+                           tuple(habit_ids))
+            #Update the stored streak state in the same transaction
+            updates = []
+            out_of_order = []
+            for habit_id, periodicity, *state in streak_states:
+                habit = Habit(name=habit_id, periodicity=periodicity)
+                habit.streak, habit.longest_streak, habit.last_completed = state
+                if habit.last_completed is not None and completed_at < habit.last_completed:
+                    #Completions that arrive out of order need a full recalculation
+                    out_of_order.append(habit_id)
+                else:
+                    habit.advance_streak(completed_at)
+                    updates.append((habit.streak, habit.longest_streak, habit.last_completed, habit_id))
+            cursor.executemany("""
+                        UPDATE Habits SET current_streak = %s, longest_streak = %s, last_completed_at = %s
+                        WHERE habitID = %s
+                         """, updates)
+            if out_of_order:
+                rebuild_streaks(cursor, out_of_order)
+            bump_data_versions(cursor, habit_ids=habit_ids)
+
+    #Recalculate the stored streaks from the completion history (all habits if habit_ids is None)
+    def rebuild_habit_streaks(self, habit_ids=None):
+        with self.cursor() as cursor:
+            rebuild_streaks(cursor, habit_ids)
+            bump_data_versions(cursor, habit_ids=habit_ids or (), all_users=habit_ids is None)
+
+    #Recalculate the rollup tables from the completion history (all habits if habit_ids is None)
+    def rebuild_habit_rollups(self, habit_ids=None):
+        with self.cursor() as cursor:
+            rebuild_rollups(cursor, habit_ids)
+            bump_data_versions(cursor, habit_ids=habit_ids or (), all_users=habit_ids is None)
+
+    #Recalculate the completion counts and last completions from the completion history (all habits if habit_ids is None)
+    def rebuild_habit_completion_counts(self, habit_ids=None):
+        with self.cursor() as cursor:
+            rebuild_completion_counts(cursor, habit_ids)
+            bump_data_versions(cursor, habit_ids=habit_ids or (), all_users=habit_ids is None)
+
+    #Completion counts of a user's habits per period ("day", "week" or "month") from first_day to last_day:
+    #rows of (habit ID, first day of the period, completions) ordered by habit and period
+    def get_period_counts_by_user(self, user_id, period, first_day, last_day):
+        with self.cursor() as cursor:
+            cursor.execute(f"""
+                        SELECT r.habitrefID, r.period_start, r.completions FROM Habits h
+                        JOIN {ROLLUP_TABLES[period]} r ON r.habitrefID = h.habitID
+                        WHERE h.userrefID = %s AND r.period_start BETWEEN %s AND %s
+                         """, (user_id, first_day, last_day))
+            #Each habit's rows arrive in primary key order, so the sort is nearly free
+            return sorted(cursor.fetchall())
+
+    #Streaks calculated from the completion history with the chosen engine (STREAK_ENGINE by default)
+    #Returns habit ID -> (current streak, longest streak, last completion)
+    def compute_streaks(self, habit_ids, engine=None):
+        habit_ids = list(habit_ids)
+        if not habit_ids:
+            return {}
+        with self.cursor() as cursor:
+            return STREAK_ENGINES[engine or STREAK_ENGINE](cursor, habit_ids)
+
+    #Stored streak state of a habit: (current streak, longest streak, last completion)
+    def get_habit_streak(self, habit_id):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        SELECT current_streak, longest_streak, last_completed_at FROM Habits
+                        WHERE habitID = %s
+                         """, (habit_id,))
+            return cursor.fetchone()
+
+    #Data version of a user (changes with every habit or completion of the user)
+    def get_data_version(self, user_id):
+        with self.cursor() as cursor:
+            cursor.execute("SELECT data_version FROM Users WHERE userID = %s", (user_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    #Random ID of the database (it doesn't change, so it is only read once)
+    def get_database_id(self):
+        if self._database_id is None:
+            with self.cursor() as cursor:
+                cursor.execute("SELECT database_id FROM DatabaseInfo")
+                row = cursor.fetchone()
+                self._database_id = row[0] if row else ""
+        return self._database_id
+
+    #All habits of a user with their stored streak state
+    def get_habit_streaks_by_user(self, user_id):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        SELECT habitID, habitname, periodicity, current_streak, longest_streak, last_completed_at
+                        FROM Habits WHERE userrefID = %s
+                         """, (user_id,))
+            return cursor.fetchall()
+
+    def get_habits_by_user(self, user_id):
+        #Gets all habits for the logged in user with their completion count and last completion
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        SELECT habitID, habitname, periodicity, completion_count, last_completed_at FROM Habits
+                        WHERE userrefID = %s
+                         """, (user_id,))
+            return cursor.fetchall()
+
+    #Condition on the completion date for the history queries: completions from since to until
+    #(both inclusive, a date as until includes the whole day), the index on (habitrefID, completedate)
+    #turns it into a range scan
+    @staticmethod
+    def _date_window(since=None, until=None, column="completedate"):
+        condition, params = "", ()
+        if since is not None:
+            condition += f" AND {column} >= %s"
+            params += (since,)
+        if until is not None:
+            if isinstance(until, datetime):
+                condition += f" AND {column} <= %s"
+                params += (until,)
+            else:
+                condition += f" AND {column} < %s"
+                params += (until + timedelta(days=1),)
+        return condition, params
+
+    #Completion history for streak calculation
+    def get_completion_history_for_habit(self, habit_id, since=None, until=None):
+        #Gets all completion records for a specific habit (optionally only those in a time window)
+        window, window_params = self._date_window(since, until)
+        with self.cursor() as cursor:
+            cursor.execute(f"""
+                        SELECT completedate FROM CompletionHistory
+                        WHERE habitrefID = %s {window}
+                        ORDER BY completedate DESC
+                         """, (habit_id, *window_params))
+            return cursor.fetchall() #Returns a list of completion dates for a specific habit
+
+    #Completion dates of a habit, oldest first, read from an unbuffered cursor in batches
+    #(a generator of datetimes, so the history is never held in memory)
+    def iter_completion_history(self, habit_id, batch_size=STREAM_BATCH_SIZE, since=None, until=None):
+        window, window_params = self._date_window(since, until)
+        rows = self.stream(f"""
+                        SELECT completedate FROM CompletionHistory
+                        WHERE habitrefID = %s {window}
+                        ORDER BY completedate
+                         """, (habit_id, *window_params), batch_size)
+        return (row[0] for row in rows)
 
+    #Completion history for several habits in one query (avoids one query per habit)
+    def get_completion_history_for_habits(self, habit_ids, since=None, until=None):
+        #Gets all completion records for the given habits, grouped by habit ID
+        history = {habit_id: [] for habit_id in habit_ids}
+        if not history:
+            return history
+        placeholders = ", ".join(["%s"] * len(history))
+        window, window_params = self._date_window(since, until)
+        with self.cursor() as cursor:
+            cursor.execute(f"""
+                        SELECT habitrefID, completedate FROM CompletionHistory
+                        WHERE habitrefID IN ({placeholders}) {window}
+                        ORDER BY habitrefID DESC, completedate DESC
+                         """, (*history, *window_params))
+            for habit_id, completedate in cursor.fetchall():
+                history[habit_id].append(completedate)
+        return history #Returns a dictionary of habit ID -> list of completion dates (newest first)
+
+    #Completion history for all habits of a user in one query
+    def get_completion_history_for_user(self, user_id, since=None, until=None):
+        #Gets all completion records of the user's habits, grouped by habit ID
+        history = {}
+        window, window_params = self._date_window(since, until, "c.completedate")
+        with self.cursor() as cursor:
+            cursor.execute(f"""
+                        SELECT c.habitrefID, c.completedate FROM Habits h
+                        JOIN CompletionHistory c ON c.habitrefID = h.habitID
+                        WHERE h.userrefID = %s {window}
+                         """, (user_id, *window_params))
+            for habit_id, completedate in cursor.fetchall():
+                history.setdefault(habit_id, []).append(completedate)
+        #Sorting here avoids a filesort of the joined rows, each list already arrives in index order
+        for dates in history.values():
+            dates.sort(reverse=True)
+        return history #Habits without completions are not included
+
+    #Allow users to get habits by periodicity
+    def get_habits_by_periodicity(self, user_id, periodicity):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        SELECT habitID, habitname, periodicity, created_at, completion_count, last_completed_at FROM Habits
+                        WHERE userrefID = %s AND periodicity = %s
+                         """, (user_id, periodicity))
+            return cursor.fetchall() #Returns a list of all habits that meet the criteria
+
+    #Completion times of several habits as whole seconds since 0001-01-01 (see habit.to_seconds),
+    #streamed in habit and date order for CompactHabit, so no datetime objects are created
+    def stream_completion_seconds(self, habit_ids):
+        habit_ids = tuple(habit_ids)
+        if not habit_ids:
+            return iter(())
+        placeholders = ", ".join(["%s"] * len(habit_ids))
+        return self.stream(f"""
+                        SELECT habitrefID,
+                               CAST((TO_DAYS(completedate) - 365) * 86400 + TIME_TO_SEC(completedate) AS SIGNED)
+                        FROM CompletionHistory
+                        WHERE habitrefID IN ({placeholders})
+                        ORDER BY habitrefID, completedate
+                         """, habit_ids)
+
+    #Completion dates of several habits, streamed in habit and date order (oldest first)
+    def stream_completion_history(self, habit_ids, since=None, until=None):
+        habit_ids = tuple(habit_ids)
+        if not habit_ids:
+            return iter(())
+        placeholders = ", ".join(["%s"] * len(habit_ids))
+        window, window_params = self._date_window(since, until)
+        return self.stream(f"""
+                        SELECT habitrefID, completedate FROM CompletionHistory
+                        WHERE habitrefID IN ({placeholders}) {window}
+                        ORDER BY habitrefID, completedate
+                         """, (*habit_ids, *window_params))
+
+    #Smallest and largest user ID, used to split the users into shards (None, None without users)
+    def get_user_id_range(self):
+        with self.cursor() as cursor:
+            cursor.execute("SELECT MIN(userID), MAX(userID) FROM Users")
+            return cursor.fetchone()
+
+    #Habits of all users with an ID between first_user_id and last_user_id (inclusive)
+    def get_habits_by_user_range(self, first_user_id, last_user_id):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                        SELECT habitID, userrefID, habitname, periodicity FROM Habits
+                        WHERE userrefID BETWEEN %s AND %s
+                         """, (first_user_id, last_user_id))
+            return cursor.fetchall()
+
+    #Habits of the users first_user_id..last_user_id whose last completion is before the cutoff of their
+    #periodicity (see habit.broken_cutoffs), streamed in user order:
+    #rows of (habit ID, user ID, habit name, periodicity, last completion)
+    def stream_broken_habits(self, first_user_id, last_user_id, cutoffs):
+        return self.stream("""
+                        SELECT habitID, userrefID, habitname, periodicity, last_completed_at FROM Habits
+                        WHERE userrefID BETWEEN %s AND %s
+                          AND ((periodicity = 'daily' AND last_completed_at < %s)
+                            OR (periodicity = 'weekly' AND last_completed_at < %s)
+                            OR (periodicity = 'monthly' AND last_completed_at < %s))
+                         """, (first_user_id, last_user_id, cutoffs["daily"], cutoffs["weekly"], cutoffs["monthly"]))
+
+    #Filter on usernames for the export queries
+    @staticmethod
+    def _username_filter(usernames, column="u.username"):
+        if usernames is None:
+            return "", ()
+        usernames = tuple(usernames)
+        placeholders = ", ".join(["%s"] * len(usernames))
+        return f"WHERE {column} IN ({placeholders})", usernames
+
+    #Streams the users for an export (all users if usernames is None)
+    def stream_users(self, usernames=None):
+        condition, params = self._username_filter(usernames, "username")
+        return self.stream(f"SELECT username, password FROM Users {condition}", params)
+
+    #Streams the habits for an export with the username of their owner
+    def stream_habits(self, usernames=None):
+        condition, params = self._username_filter(usernames)
+        return self.stream(f"""
+                        SELECT h.habitID, u.username, h.habitname, h.periodicity, h.created_at FROM Habits h
+                        JOIN Users u ON u.userID = h.userrefID
+                        {condition}
+                         """, params)
+
+    #Streams the completions for an export
+    def stream_completions(self, usernames=None):
+        condition, params = self._username_filter(usernames)
+        if not condition:
+            return self.stream("SELECT habitrefID, completedate FROM CompletionHistory")
+        return self.stream(f"""
+                        SELECT c.habitrefID, c.completedate FROM Users u
+                        JOIN Habits h ON h.userrefID = u.userID
+                        JOIN CompletionHistory c ON c.habitrefID = h.habitID
+                        {condition}
+                         """, params)
+
+    #Bulk import of users in one transaction, returns username -> user ID
+    #Existing usernames are mapped to their user (the password is not changed), so a failed import can be rerun
+    def insert_users(self, users):
+        if not users:
+            return {}
+        with self.cursor() as cursor:
+            usernames = tuple(username for username, _ in users)
+            placeholders = ", ".join(["%s"] * len(usernames))
+            cursor.execute(f"SELECT username, userID FROM Users WHERE username IN ({placeholders})", usernames)
+            user_ids = dict(cursor.fetchall())
+            new_users = [user for user in users if user[0] not in user_ids]
+            if new_users:
+                #A multi-row insert (the connector rewrites executemany for INSERT ... VALUES)
+                cursor.executemany("INSERT INTO Users(username, password) VALUES (%s, %s)", new_users)
+                cursor.execute(f"SELECT username, userID FROM Users WHERE username IN ({placeholders})", usernames)
+                user_ids = dict(cursor.fetchall())
+            return user_ids
+
+    #Bulk import of habits (habitname, periodicity, created_at, user ID) in one transaction, returns the new habit IDs
+    def insert_habits(self, habits):
+        habit_ids = []
+        with self.cursor() as cursor:
+            #One statement per habit, the IDs of a multi-row insert are not guaranteed to be consecutive
+            for habit in habits:
+                cursor.execute("""
+                            INSERT INTO Habits(habitname, periodicity, created_at, userrefID)
+                             VALUES (%s, %s, %s, %s)
+                             """, habit)
+                habit_ids.append(cursor.lastrowid)
+            bump_data_versions(cursor, user_ids=list({habit[3] for habit in habits}))
+        return habit_ids
+
+    #Bulk import of completions (habit ID, completion date) as one multi-row insert in one transaction
+    #(the completion counts and last completions are updated, the stored streaks are not: call rebuild_habit_streaks afterwards)
+    def insert_completions(self, completions):
+        if not completions:
+            return
+        with self.cursor() as cursor:
+            cursor.executemany("INSERT INTO CompletionHistory(habitrefID, completedate) VALUES (%s, %s)", completions)
+            add_to_rollups(cursor, completions)
+            counts = Counter(habit_id for habit_id, _ in completions)
+            last_completed = {}
+            for habit_id, completed_at in completions:
+                last_completed[habit_id] = max(completed_at, last_completed.get(habit_id, completed_at))
+            cursor.executemany("""
+                        UPDATE Habits SET completion_count = completion_count + %s,
+                                          last_completed_at = GREATEST(COALESCE(last_completed_at, %s), %s)
+                        WHERE habitID = %s
+                         """, [(count, last_completed[habit_id], last_completed[habit_id], habit_id)
+                               for habit_id, count in sorted(counts.items())])
+            bump_data_versions(cursor, habit_ids=list({habit_id for habit_id, _ in completions}))
+
+
+#Cursor that runs EXPLAIN instead of the statement, used by check_query_plans()
+class _ExplainCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.plans = []
+        self.lastrowid = None
+        self.rowcount = 0
+
+    def execute(self, statement, params=()):
+        self._cursor.execute("EXPLAIN " + statement, params)
+        columns = self._cursor.column_names
+        self.plans.append((statement, [dict(zip(columns, row)) for row in self._cursor.fetchall()]))
+
+    def executemany(self, statement, seq_params):
+        for params in seq_params[:1]:
+            self.execute(statement, params)
+
+    def __iter__(self):
+        return iter(())
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def fetchmany(self, size=None):
+        return []
+
+
+#Data-access object that records the query plans of its queries without running them
+class _QueryPlanRecorder(HabitDatabase):
+    def __init__(self, pool):
+        super().__init__(pool)
+        self.plans = []
+
+    @contextmanager
+    def cursor(self):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                explain_cursor = _ExplainCursor(cursor)
+                yield explain_cursor
+                self.plans.extend(explain_cursor.plans)
+            finally:
+                cursor.close()
+                connection.rollback()
+
+    #Streaming queries are explained right away instead of being read
+    def stream(self, statement, params=(), batch_size=STREAM_BATCH_SIZE):
+        with self.cursor() as cursor:
+            cursor.execute(statement, params)
+        return iter(())
+
+#Every query of HabitDatabase with sample arguments for check_query_plans()
+QUERY_PLAN_SAMPLES = [
+    ("insert_new_user", ("username", "password")),
+    ("get_user_by_username", ("username",)),
+    ("get_user_password", (1,)),
+    ("update_user_password", (1, "password")),
+    ("insert_new_habit", ("habit", "daily", 1)),
+    ("delete_habit", (1, 1)),
+    ("display_habits_for_deletion", (1,)),
+    ("insert_habit_completions", ([1, 2, 3],)),
+    ("rebuild_habit_streaks", ([1, 2, 3],)),
+    ("compute_streaks", ([1, 2, 3], "python")),
+    ("compute_streaks", ([1, 2, 3], "rollup")),
+    ("rebuild_habit_rollups", ([1, 2, 3],)),
+    ("rebuild_habit_completion_counts", ([1, 2, 3],)),
+    ("get_period_counts_by_user", (1, "day", datetime(2024, 1, 1), datetime(2024, 12, 31))),
+    #The "sql" engine is not listed, its window functions sort each habit's completions by design
+    ("get_habit_streak", (1,)),
+    ("get_data_version", (1,)),
+    ("get_database_id", ()),
+    ("get_habit_streaks_by_user", (1,)),
+    ("get_habits_by_user", (1,)),
+    ("get_completion_history_for_habit", (1,)),
+    ("get_completion_history_for_habit", (1, datetime(2024, 1, 1), datetime(2024, 3, 31))),
+    ("iter_completion_history", (1,)),
+    ("get_completion_history_for_habits", ([1, 2, 3],)),
+    ("get_completion_history_for_user", (1,)),
+    ("get_habits_by_periodicity", (1, "daily")),
+    ("stream_completion_seconds", ([1, 2, 3],)),
+    ("stream_completion_history", ([1, 2, 3],)),
+    ("stream_completion_history", ([1, 2, 3], datetime(2024, 1, 1), datetime(2024, 3, 31))),
+    ("get_user_id_range", ()),
+    ("get_habits_by_user_range", (1, 100)),
+    ("stream_broken_habits", (1, 100, {"daily": datetime(2024, 1, 1), "weekly": datetime(2024, 1, 1),
+                                       "monthly": datetime(2024, 1, 1)})),
+    ("stream_users", (["username"],)),
+    ("stream_habits", (["username"],)),
+    ("stream_completions", (["username"],)),
+    ("insert_users", ([("username", "password")],)),
+    ("insert_habits", ([("habit", "daily", datetime(2024, 1, 1), 1)],)),
+    ("insert_completions", ([(1, datetime(2024, 1, 1))],)),
+]
+
+#Runs EXPLAIN on every query and returns the ones that need a full table scan or a filesort
+#(the plans are only meaningful on a database with realistic amounts of data)
+def check_query_plans():
+    recorder = _QueryPlanRecorder(get_database().pool)
+    problems = []
+    for method_name, args in QUERY_PLAN_SAMPLES:
+        recorder.plans = []
+        getattr(recorder, method_name)(*args)
+        for statement, plan in recorder.plans:
+            for row in plan:
+                #Inserts have no access path to check
+                if row.get("select_type") == "INSERT":
+                    continue
+                extra = row.get("Extra") or ""
+                if row.get("type") == "ALL":
+                    problems.append(f"{method_name}: full table scan of {row.get('table')}")
+                if "Using filesort" in extra:
+                    problems.append(f"{method_name}: filesort on {row.get('table')}")
+    return problems #An empty list means all queries use indexes
+
+#The shared data-access object is only created (and the schema checked) when the first query runs
+_database = None
+_database_lock = threading.Lock()
+
+def get_database():
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                database = HabitDatabase(ConnectionPool(POOL_SIZE, **DB_CONFIG))
+                try:
+                    database.check_schema_version()
+                except Exception:
+                    database.close()
+                    raise
+                _database = database
+    return _database
+
+#Close the shared connections (a new pool is created by the next query)
+def close_database():
+    global _database
+    with _database_lock:
+        database, _database = _database, None
+    if database is not None:
+        database.close()
+
+#Forget the shared data-access object without closing it, used by forked worker processes
+#(their copies of the connections still belong to the parent process)
+def forget_database():
+    global _database
+    _database = None
+
+#Applies all pending migrations, uses its own connection because the schema check would fail
+def migrate():
+    database = HabitDatabase(ConnectionPool(1, **DB_CONFIG))
+    try:
+        return database.migrate()
+    finally:
+        database.close()
+
+#Module-level functions used by cli.py, they use the shared data-access object
+def insert_new_user(username_input, hashed_password):
+    return get_database().insert_new_user(username_input, hashed_password)
 
-#Allow users to log in
 def get_user_by_username(entry_username):
-    #App retrieves stored password
-    mycursor.execute(""" SELECT userID, password FROM users WHERE username = %s
-                     """, (entry_username,))
-    result = mycursor.fetchone() #Fetch one row from the result of the query
-    return result #Return result so that cli.py can use it
+    return get_database().get_user_by_username(entry_username)
+
+def get_user_password(user_id):
+    return get_database().get_user_password(user_id)
+
+def update_user_password(user_id, hashed_password):
+    return get_database().update_user_password(user_id, hashed_password)
 
-#Allow logged in users to create a new habit
 def insert_new_habit(habit_name, periodicity, user_id):
-    mycursor.execute("""
-                    INSERT INTO habits(habitname, periodicity, created_at, userrefID)
-                     VALUES(%s, %s, NOW(), %s)
-                     """, (habit_name, periodicity, user_id))
-    db.commit()
+    return get_database().insert_new_habit(habit_name, periodicity, user_id)
 
-#Allow logged in users to delete a habit
 def delete_habit(habit_id, user_id):
-    #Make sure the habit belongs to the logged in user
-    mycursor.execute("""
-                    DELETE FROM habits
-                    WHERE habitID = %s AND userrefID = %s
-                     """, (habit_id, user_id))
-    db.commit()
-
-    if mycursor.rowcount > 0:
-        return True
-    return False
-
-#Display habits for deleting
+    return get_database().delete_habit(habit_id, user_id)
+
 def display_habits_for_deletion(user_id):
-    mycursor.execute("""
-                    SELECT habitID, habitname, periodicity FROM habits
-                    WHERE userrefID = %s
-                     """, (user_id,))
-    return mycursor.fetchall() #Return the list of habits for the user
-
-#Allow users to complete a habit
-def insert_habit_completion(habit_id):
-    #Insert a completion record for a habit in the completionhistory table
-    mycursor.execute("""
-                    INSERT INTO CompletionHistory(habitrefID, completedate)
-                     VALUES (%s, NOW())
-                     """, (habit_id,))
-    db.commit()
+    return get_database().display_habits_for_deletion(user_id)
+
+def insert_habit_completion(habit_id, completed_at=None):
+    return get_database().insert_habit_completion(habit_id, completed_at)
+
+def insert_habit_completions(habit_ids, completed_at=None):
+    return get_database().insert_habit_completions(habit_ids, completed_at)
+
+def rebuild_habit_streaks(habit_ids=None):
+    return get_database().rebuild_habit_streaks(habit_ids)
+
+def rebuild_habit_rollups(habit_ids=None):
+    return get_database().rebuild_habit_rollups(habit_ids)
+
+def rebuild_habit_completion_counts(habit_ids=None):
+    return get_database().rebuild_habit_completion_counts(habit_ids)
+
+def get_period_counts_by_user(user_id, period, first_day, last_day):
+    return get_database().get_period_counts_by_user(user_id, period, first_day, last_day)
+
+def compute_streaks(habit_ids, engine=None):
+    return get_database().compute_streaks(habit_ids, engine)
+
+def get_habit_streak(habit_id):
+    return get_database().get_habit_streak(habit_id)
+
+def get_data_version(user_id):
+    return get_database().get_data_version(user_id)
+
+def get_database_id():
+    return get_database().get_database_id()
+
+def get_habit_streaks_by_user(user_id):
+    return get_database().get_habit_streaks_by_user(user_id)
 
 def get_habits_by_user(user_id):
-    #Gets all habits for the logged in user
-    mycursor.execute("""
-                    SELECT habitID, habitname, periodicity FROM Habits
-                    WHERE userrefID = %s
-                     """, (user_id,))
-    return mycursor.fetchall()
-
-#Completion history for streak calculation
-def get_completion_history_for_habit(habit_id):
-    #Gets all completion records for a specific habit
-    mycursor.execute("""
-                    SELECT completedate FROM CompletionHistory
-                    WHERE habitrefID = %s 
-                    ORDER BY completedate DESC
-                     """, (habit_id,))
-    return mycursor.fetchall() #Returns a list of completion dates for a specific habit
-
-#Allow users to get habits by periodicity
+    return get_database().get_habits_by_user(user_id)
+
+def get_completion_history_for_habit(habit_id, since=None, until=None):
+    return get_database().get_completion_history_for_habit(habit_id, since, until)
+
+def iter_completion_history(habit_id, batch_size=STREAM_BATCH_SIZE, since=None, until=None):
+    return get_database().iter_completion_history(habit_id, batch_size, since, until)
+
+def get_completion_history_for_habits(habit_ids, since=None, until=None):
+    return get_database().get_completion_history_for_habits(habit_ids, since, until)
+
+def get_completion_history_for_user(user_id, since=None, until=None):
+    return get_database().get_completion_history_for_user(user_id, since, until)
+
 def get_habits_by_periodicity(user_id, periodicity):
-    mycursor.execute("""
-                    SELECT habitID, habitname, periodicity, created_at FROM Habits
-                    WHERE userrefID = %s AND periodicity = %s
-                     """, (user_id, periodicity))
-    return mycursor.fetchall() #Returns a list of all habits that meet the criteria
\ No newline at end of file
+    return get_database().get_habits_by_periodicity(user_id, periodicity)
+
+def stream_completion_seconds(habit_ids):
+    return get_database().stream_completion_seconds(habit_ids)
+
+def stream_completion_history(habit_ids, since=None, until=None):
+    return get_database().stream_completion_history(habit_ids, since, until)
+
+def get_user_id_range():
+    return get_database().get_user_id_range()
+
+def get_habits_by_user_range(first_user_id, last_user_id):
+    return get_database().get_habits_by_user_range(first_user_id, last_user_id)
+
+def stream_broken_habits(first_user_id, last_user_id, cutoffs):
+    return get_database().stream_broken_habits(first_user_id, last_user_id, cutoffs)
+
+
+#Running "python database.py" installs or upgrades the tables
+if __name__ == "__main__":
+    applied_versions = migrate()
+    print(f"Applied schema versions: {applied_versions}" if applied_versions else "The database schema is up to date.")
@@ -1,7 +1,11 @@
 #Habit class
 
 #import datetime
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+#Typed arrays for the compact completion history
+from array import array
+#Timings for --profile
+from profiling import instrument
 
 #Definition of the class
 class Habit:
@@ -11,18 +15,69 @@ class Habit:
         self.periodicity = periodicity
         self.created_at = created_at or datetime.now()
         self.streak = 0
+        self.longest_streak = 0
+        self.last_completed = None
         self.completion_history = []
+        #Number of completions included in the running streak state
+        self._counted_completions = 0
     
     #Definition of the check_off function
     def check_off(self):
-        #Log a completion timestamp and update the streak
+        #Log a completion timestamp and update the streak, returns the timestamp
         timestamp = datetime.now()
-        self.completion_history.append(timestamp)
-        self.calculate_streak()
-        print(f"Habit '{self.name}' marked as complete '{timestamp}'.")
+        self.add_completion(timestamp)
+        return timestamp
+
+    #Definition of the add completion function
+    def add_completion(self, completed_at):
+        #Completions that arrive in time order update the streak in constant time
+        in_order = self.last_completed is None or completed_at >= self.last_completed
+        #The history may have been replaced since the streak was last calculated
+        up_to_date = self._counted_completions == len(self.completion_history)
+        self.completion_history.append(completed_at)
+        if in_order and up_to_date:
+            self.advance_streak(completed_at)
+            self._counted_completions += 1
+        else:
+            self._recalculate_streak()
+
+    #Definition of the load state function
+    def load_state(self, completion_history, streak, longest_streak, last_completed):
+        #Sets the completion history together with its stored (up-to-date) streak state, so further
+        #completions advance the streak in constant time instead of recalculating it
+        self.completion_history = sorted(completion_history)
+        self.streak, self.longest_streak, self.last_completed = streak, longest_streak, last_completed
+        self._counted_completions = len(self.completion_history)
+
+    #Definition of the advance streak function
+    def advance_streak(self, completed_at):
+        #Update the running streak state with a completion that is not older than the last one
+        if self.last_completed is not None and self.is_continuous(self.last_completed, completed_at):
+            self.streak += 1
+        else:
+            self.streak = 1 #Starts a new streak
+        self.longest_streak = max(self.longest_streak, self.streak)
+        self.last_completed = completed_at
+
+    #Definition of the streak from completions function
+    def streak_from_completions(self, completions):
+        #Calculates the streak in one pass over completion times in ascending order. Accepts any iterable
+        #(e.g. database.iter_completion_history), the completions are not added to the completion history
+        self.streak = 0
+        self.longest_streak = 0
+        self.last_completed = None
+        for completed_at in completions:
+            self.advance_streak(completed_at)
+        return self.streak, self.longest_streak
 
     #Definition of the calculate streak function
+    @instrument("habit.calculate_streak")
     def calculate_streak(self):
+        #Returns (current streak, longest streak), the caller decides how to show them
+        self._recalculate_streak()
+        return self.streak, self.longest_streak
+
+    def _recalculate_streak(self):
         #Calculation of the streak based on the completion history
         streak = 0
         longest_streak = 0
@@ -44,8 +99,8 @@ class Habit:
 
         self.longest_streak = max(longest_streak, streak)
         self.streak = streak
-        print(f"Longest streak for '{self.name}': {self.longest_streak} completions in a row.")
-        print(f"Current Streak for '{self.name}': {self.streak} completions in a row. ")
+        self.last_completed = last_completed
+        self._counted_completions = len(self.completion_history)
 
     def is_continuous(self, last_completed, current_completed):
         #Check if the habit completion is continuous based on the periodicity
@@ -66,8 +121,8 @@ class Habit:
 
     #Definition of the 'streak is broken' function
     def is_broken(self):
+        #Without completions there is no streak that could be broken
         if not self.completion_history:
-            print(f"No completions recorded for '{self.name}'. Streak cannot be broken.")
             return False
         last_completed = self.completion_history[-1]
         now = datetime.now()
@@ -76,8 +131,193 @@ class Habit:
         elif self.periodicity == "weekly":
             return (now - last_completed).days > 7
         elif self.periodicity == "monthly":
-            next_month = (last_completed.month % 12) + 1
-            next_year = last_completed.year + (last_completed.month // 12)
-            return now.month > next_month or now.year > next_year
+            #Broken once a whole calendar month passed without a completion
+            return (now.year - last_completed.year) * 12 + now.month - last_completed.month > 1
+        else:
+            raise ValueError(f"Invalid periodicity: {self.periodicity}")
+
+
+#Completion times of CompactHabit are whole seconds since 0001-01-01 00:00 (naive, like the database values)
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def to_seconds(timestamp):
+    return timestamp.toordinal() * SECONDS_PER_DAY + timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+
+def from_seconds(seconds):
+    day, seconds_of_day = divmod(seconds, SECONDS_PER_DAY)
+    return datetime.fromordinal(day) + timedelta(seconds=seconds_of_day)
+
+#Year and month of a day ordinal
+def _year_month(day):
+    month_date = date.fromordinal(day)
+    return month_date.year, month_date.month
+
+#Definition of the compact class: same streak rules as Habit, but the completion history
+#is a typed array of seconds (8 bytes per completion) and instances have no __dict__
+class CompactHabit:
+    __slots__ = ("name", "periodicity", "created_at", "streak", "longest_streak", "last_completed",
+                 "completion_history", "_in_order")
+
+    #Initialisation of the habit
+    def __init__(self, name, periodicity, created_at=None):
+        self.name = name
+        self.periodicity = periodicity
+        self.created_at = created_at or datetime.now()
+        self.streak = 0
+        self.longest_streak = 0
+        self.last_completed = None #In seconds, see to_seconds()
+        self.completion_history = array("q")
+        self._in_order = True
+
+    #Loader that fills the array directly from database rows, either (seconds,) or (datetime,)
+    @classmethod
+    def from_rows(cls, name, periodicity, rows, created_at=None):
+        habit = cls(name, periodicity, created_at)
+        for row in rows:
+            value = row[0]
+            habit.add_completion(value if isinstance(value, int) else to_seconds(value))
+        return habit
+
+    #Definition of the check_off function
+    def check_off(self):
+        #Log a completion timestamp and update the streak
+        timestamp = datetime.now().replace(microsecond=0)
+        self.add_completion(to_seconds(timestamp))
+        return timestamp
+
+    #Definition of the add completion function (completion time in seconds)
+    def add_completion(self, completed_at):
+        history = self.completion_history
+        if self._in_order and history and completed_at < history[-1]:
+            self._in_order = False
+        history.append(completed_at)
+        if self.last_completed is None or completed_at >= self.last_completed:
+            #Completions in time order update the streak in constant time
+            if self.last_completed is not None and self.is_continuous(self.last_completed, completed_at):
+                self.streak += 1
+            else:
+                self.streak = 1
+            self.longest_streak = max(self.longest_streak, self.streak)
+            self.last_completed = completed_at
+        else:
+            self._recalculate_streak()
+
+    #Definition of the calculate streak function
+    @instrument("habit.CompactHabit.calculate_streak")
+    def calculate_streak(self):
+        #Returns (current streak, longest streak), the caller decides how to show them
+        self._recalculate_streak()
+        return self.streak, self.longest_streak
+
+    def _recalculate_streak(self):
+        #Sorting is only needed (and a copy only made) when completions were added out of order
+        completions = self.completion_history if self._in_order else sorted(self.completion_history)
+        streak = 0
+        longest_streak = 0
+        last_completed = None
+        for completion in completions:
+            if last_completed is not None and self.is_continuous(last_completed, completion):
+                streak += 1
+            else:
+                longest_streak = max(longest_streak, streak)
+                streak = 1 #Resets the streak count
+            last_completed = completion
+        self.longest_streak = max(longest_streak, streak)
+        self.streak = streak
+        self.last_completed = last_completed
+
+    def is_continuous(self, last_completed, current_completed):
+        #Check if the habit completion is continuous based on the periodicity (times in seconds)
+        last_day = last_completed // SECONDS_PER_DAY
+        current_day = current_completed // SECONDS_PER_DAY
+        if self.periodicity == "daily":
+            #Check if the current completion date is the next day
+            return current_day == last_day + 1
+
+        elif self.periodicity == "weekly":
+            #Same day of the week and at most 7 days apart
+            return current_day % 7 == last_day % 7 and (current_completed - last_completed) // SECONDS_PER_DAY <= 7
+
+        elif self.periodicity == "monthly":
+            #Check if the current completion date is in the same month
+            return current_day == last_day or _year_month(current_day) == _year_month(last_day)
+
+        return False #Default case if the periodicity doesn't match
+
+    #Definition of the 'streak is broken' function
+    def is_broken(self):
+        #Without completions there is no streak that could be broken
+        if not self.completion_history:
+            return False
+        last_completed = self.completion_history[-1]
+        now = to_seconds(datetime.now())
+        last_day = last_completed // SECONDS_PER_DAY
+        if self.periodicity == "daily":
+            return now // SECONDS_PER_DAY > last_day + 1
+        elif self.periodicity == "weekly":
+            return (now - last_completed) // SECONDS_PER_DAY > 7
+        elif self.periodicity == "monthly":
+            last_year, last_month = _year_month(last_day)
+            now_year, now_month = _year_month(now // SECONDS_PER_DAY)
+            return (now_year - last_year) * 12 + now_month - last_month > 1
         else:
-            raise ValueError(f"Invalid periodicity: {self.periodicity}")
\ No newline at end of file
+            raise ValueError(f"Invalid periodicity: {self.periodicity}")
+
+
+#Groups rows of (habit ID, completion time) ordered by habit into CompactHabit objects
+#habits is a list of (habit ID, name, periodicity) rows, habits without completions are included
+def compact_habits_from_rows(habits, rows):
+    compact_habits = {habit[0]: CompactHabit(habit[1], habit[2]) for habit in habits}
+    for habit_id, completed_at in rows:
+        compact_habits[habit_id].add_completion(completed_at if isinstance(completed_at, int) else to_seconds(completed_at))
+    return compact_habits
+
+#Streak (current, longest) from completion counts per period, with the same rules as Habit.is_continuous
+#counts are (first day of the period, number of completions) in ascending order: per day for daily and
+#weekly habits, per month for monthly habits (see the rollup tables in database.py)
+def streak_from_counts(periodicity, counts):
+    streak = 0
+    longest_streak = 0
+    previous_day = None
+    for day, completions in counts:
+        if periodicity == "daily":
+            streak = streak + 1 if previous_day is not None and day - previous_day == timedelta(days=1) else 1
+            if completions > 1:
+                #A second completion on the same day starts a new streak
+                longest_streak = max(longest_streak, streak)
+                streak = 1
+        elif periodicity == "weekly":
+            #Completions on the same weekday at most 7 days apart continue the streak (also on the same day)
+            streak = streak + 1 if previous_day is not None and day - previous_day == timedelta(days=7) else 1
+            streak += completions - 1
+        elif periodicity == "monthly":
+            #Only completions in the same month continue the streak
+            streak = completions
+        longest_streak = max(longest_streak, streak)
+        previous_day = day
+    return streak, longest_streak
+
+#First day of the month `months` months after the month of a date
+def _add_months(day, months):
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return datetime(year, month + 1, 1)
+
+#Time at which the streak of a habit breaks (Habit.is_broken turns true) if it isn't completed again
+def break_time(periodicity, last_completed):
+    if periodicity == "daily":
+        #The whole next day may pass without a completion
+        return datetime.combine(last_completed.date() + timedelta(days=2), datetime.min.time())
+    elif periodicity == "weekly":
+        return last_completed + timedelta(days=8)
+    elif periodicity == "monthly":
+        return _add_months(last_completed, 2)
+    else:
+        raise ValueError(f"Invalid periodicity: {periodicity}")
+
+#Inverse of break_time for queries: at the time `at`, a habit is broken if its last completion is
+#before the cutoff of its periodicity (completion times are whole seconds, like the DATETIME columns)
+def broken_cutoffs(at):
+    at = at.replace(microsecond=0)
+    return {"daily": datetime.combine(at.date() - timedelta(days=1), datetime.min.time()),
+            "weekly": at - timedelta(days=8) + timedelta(seconds=1),
+            "monthly": _add_months(at, -1)}
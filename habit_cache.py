@@ -0,0 +1,70 @@
+#Habits of the logged in user, kept in memory for the interactive menu
+"""
+The habits and their completion histories are loaded once after login (two queries).
+Creating, deleting and completing habits write to the database and update the cache in place,
+so streak views, grouping and analytics read the cache instead of querying the database again.
+The read methods return the same rows as the functions of the same name in database.py
+(get_habits_by_periodicity without the created_at column, which the menu doesn't show).
+The completion count of a habit is the length of its history, its last completion is the stored one.
+"""
+from datetime import datetime
+from database import (get_habit_streaks_by_user, get_completion_history_for_user, insert_new_habit,
+                      delete_habit, insert_habit_completions)
+from habit import Habit
+from profiling import instrument
+
+class HabitCache:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.habits = {} #habit ID -> Habit (in database order)
+        self.load()
+
+    #Load the habits with their stored streaks and completion histories
+    @instrument("habit_cache.load")
+    def load(self):
+        history = get_completion_history_for_user(self.user_id)
+        self.habits = {}
+        for habit_id, habit_name, periodicity, current_streak, longest_streak, last_completed_at in get_habit_streaks_by_user(self.user_id):
+            habit = Habit(name=habit_name, periodicity=periodicity)
+            habit.load_state(history.get(habit_id, []), current_streak, longest_streak, last_completed_at)
+            self.habits[habit_id] = habit
+
+    def insert_new_habit(self, habit_name, periodicity):
+        habit_id = insert_new_habit(habit_name, periodicity, self.user_id)
+        self.habits[habit_id] = Habit(name=habit_name, periodicity=periodicity)
+        return habit_id
+
+    def delete_habit(self, habit_id):
+        success = delete_habit(habit_id, self.user_id)
+        if success:
+            self.habits.pop(habit_id, None)
+        return success
+
+    def insert_habit_completions(self, habit_ids, completed_at=None):
+        #The same timestamp as the database rows (DATETIME columns store whole seconds)
+        completed_at = completed_at or datetime.now().replace(microsecond=0)
+        habit_ids = list(dict.fromkeys(habit_ids))
+        insert_habit_completions(habit_ids, completed_at)
+        for habit_id in habit_ids:
+            self.habits[habit_id].add_completion(completed_at)
+
+    def get_habits_by_user(self):
+        return [(habit_id, habit.name, habit.periodicity, len(habit.completion_history), habit.last_completed)
+                for habit_id, habit in self.habits.items()]
+
+    def get_habit_streaks_by_user(self):
+        return [(habit_id, habit.name, habit.periodicity, habit.streak, habit.longest_streak, habit.last_completed)
+                for habit_id, habit in self.habits.items()]
+
+    def get_habits_by_periodicity(self, periodicity):
+        return [(habit_id, habit.name, habit.periodicity, len(habit.completion_history), habit.last_completed)
+                for habit_id, habit in self.habits.items() if habit.periodicity == periodicity]
+
+    #Completion dates of a habit, oldest first (like database.iter_completion_history)
+    def iter_completion_history(self, habit_id):
+        return iter(self.habits[habit_id].completion_history)
+
+    #Newest completion first, habits without completions are not included (like the database query)
+    def get_completion_history_for_user(self):
+        return {habit_id: habit.completion_history[::-1] for habit_id, habit in self.habits.items()
+                if habit.completion_history}
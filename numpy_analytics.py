@@ -0,0 +1,47 @@
+#Vectorized analytics engine, gives the same results as analytics.py for long completion histories
+import numpy as np
+
+#One day in microseconds (the unit of the datetime64 arrays)
+DAY = 24 * 60 * 60 * 1_000_000
+
+#Conversion of a list of completion dates to a sorted datetime64 array
+def to_datetime64(completion_dates):
+    return np.sort(np.asarray(completion_dates, dtype="datetime64[us]"))
+
+#Gaps between consecutive completions in whole days (rounded down like timedelta.days)
+def completion_gaps(completion_dates):
+    dates = to_datetime64(completion_dates)
+    return np.diff(dates.astype(np.int64)) // DAY
+
+#Calculation of the average time between completions of a habit
+def average_completion_time(completion_dates):
+    #Need enough data for the calculation
+    if len(completion_dates) < 2:
+        return None
+    gaps = completion_gaps(completion_dates)
+    return int(gaps.sum()) / len(gaps)
+
+#Calculation of the habit with the most consistent completions
+def most_consistent_habit(habit_data):
+    def consistency_score(dates):
+        if len(dates) < 2:
+            return float('inf')
+        gaps = completion_gaps(dates)
+        #The smaller the score, the more consistent it is
+        return int(gaps.max() - gaps.min())
+    scores = {habit: consistency_score(dates) for habit, dates in habit_data.items()}
+    return min(habit_data, key=scores.__getitem__)
+
+#Number of runs of completions on consecutive days (runs with at least two completions)
+def count_streaks(completion_dates):
+    if len(completion_dates) < 2:
+        return 0
+    consecutive = (completion_gaps(completion_dates) == 1).astype(np.int8)
+    #Each run starts where a consecutive gap follows a non-consecutive one
+    return int(np.count_nonzero(np.diff(consecutive, prepend=0) == 1))
+
+#Calculation of total and average streaks across all habits
+def aggregate_streak_analysis(habit_data):
+    total_streaks = sum(count_streaks(dates) for dates in habit_data.values())
+    avg_streaks = total_streaks / len(habit_data) if habit_data else 0
+    return {"total streaks" : total_streaks, "average streaks" : avg_streaks}
@@ -0,0 +1,130 @@
+#Instrumentation for the --profile flag of cli.py
+"""
+Functions decorated with instrument() record their call count, wall time and (for database
+functions) the number of rows they return. Nothing is recorded unless enable() was called,
+so a disabled profiler only costs one check of a global flag per call.
+The times are inclusive: a function that calls another instrumented function includes its time.
+"""
+import functools
+import json
+import sys
+import threading
+import time
+
+enabled = False
+_stats = {} #name -> [calls, rows, seconds]
+_lock = threading.Lock()
+_started_at = None
+
+#Start recording (also times everything that is written to the console)
+def enable():
+    global enabled, _started_at
+    enabled = True
+    _started_at = time.perf_counter()
+    if not isinstance(sys.stdout, _TimedOutput):
+        sys.stdout = _TimedOutput(sys.stdout)
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def record(name, seconds, rows=0):
+    with _lock:
+        stats = _stats.setdefault(name, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += rows
+        stats[2] += seconds
+
+#Number of rows in a database result
+def _count_rows(result):
+    if result is None or isinstance(result, (bool, int)):
+        return 0
+    if isinstance(result, dict):
+        #Histories grouped by habit count their completions
+        return sum(len(value) if isinstance(value, list) else 1 for value in result.values())
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+#Iterators (streaming queries) are timed while rows are read and recorded when they are finished
+def _counted_rows(name, iterator, seconds):
+    rows = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+            rows += 1
+            yield row
+    finally:
+        record(name, seconds, rows)
+
+#Decorator that records the calls of a function while profiling is enabled
+def instrument(name, count_rows=False):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            if count_rows and hasattr(result, "__next__"):
+                return _counted_rows(name, result, seconds)
+            record(name, seconds, _count_rows(result) if count_rows else 0)
+            return result
+        return wrapper
+    return decorator
+
+#Class decorator that instruments all public methods of a class
+def instrument_methods(prefix, count_rows=False, exclude=()):
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if attribute.startswith("_") or attribute in exclude or not callable(value):
+                continue
+            setattr(cls, attribute, instrument(f"{prefix}.{attribute}", count_rows)(value))
+        return cls
+    return decorator
+
+#Console output wrapper that records the time spent writing
+class _TimedOutput:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        start = time.perf_counter()
+        result = self._stream.write(text)
+        record("console output", time.perf_counter() - start)
+        return result
+
+    def __getattr__(self, attribute):
+        return getattr(self._stream, attribute)
+
+#Recorded statistics with the wall time since enable()
+def snapshot(command=None):
+    with _lock:
+        functions = {name: {"calls": calls, "rows": rows, "seconds": seconds}
+                     for name, (calls, rows, seconds) in _stats.items()}
+    wall_seconds = time.perf_counter() - _started_at if _started_at is not None else 0.0
+    return {"command": command, "wall_seconds": wall_seconds, "functions": functions}
+
+#Writes the breakdown as a table (or as JSON to a file), to the console or to the given stream
+def report(command=None, path=None, stream=None):
+    profile = snapshot(command)
+    if path:
+        with open(path, "w") as file:
+            json.dump(profile, file, indent=2)
+        return
+    lines = [f"Profile for '{command}' (wall time {profile['wall_seconds'] * 1000:.1f} ms):",
+             f"{'function':<45} {'calls':>7} {'rows':>9} {'total ms':>10} {'% wall':>7}"]
+    wall_seconds = profile["wall_seconds"] or 1.0
+    for name, stats in sorted(profile["functions"].items(), key=lambda item: -item[1]["seconds"]):
+        lines.append(f"{name:<45} {stats['calls']:>7} {stats['rows']:>9} "
+                     f"{stats['seconds'] * 1000:>10.2f} {stats['seconds'] / wall_seconds * 100:>6.1f}%")
+    #Written to the original console so the report does not time itself
+    output = stream or (sys.stdout._stream if isinstance(sys.stdout, _TimedOutput) else sys.stdout)
+    output.write("\n".join(lines) + "\n")
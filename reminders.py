@@ -0,0 +1,28 @@
+#Scan of all users for broken streaks and streaks that are about to break, for reminder jobs
+"""
+The rules of Habit.is_broken are turned into one cutoff per periodicity (habit.broken_cutoffs),
+so a habit is broken if its stored last completion is before the cutoff of its periodicity.
+The users are split into shards of consecutive user IDs and each shard is one indexed query
+whose rows are streamed, so the memory doesn't grow with the number of habits:
+python cli.py scan-broken --horizon_days 1
+"""
+from datetime import datetime, timedelta
+from database import get_user_id_range, stream_broken_habits
+from habit import break_time, broken_cutoffs
+from report import shard_ranges
+
+#Number of user ID ranges of a scan
+SCAN_SHARDS = 16
+
+#Habits of all users whose streak is broken at the time `at` (default: now) or breaks within horizon_days after it
+#Yields (habit ID, user ID, habit name, periodicity, last completion, time the streak breaks, status),
+#the status is "broken" or "at risk". Habits without completions have no streak and are never included.
+def scan_broken_habits(horizon_days=0, shards=SCAN_SHARDS, at=None):
+    at = at or datetime.now()
+    cutoffs = broken_cutoffs(at + timedelta(days=horizon_days))
+    first_user_id, last_user_id = get_user_id_range()
+    for first, last in shard_ranges(first_user_id, last_user_id, shards):
+        for habit_id, user_id, habit_name, periodicity, last_completed_at in stream_broken_habits(first, last, cutoffs):
+            breaks_at = break_time(periodicity, last_completed_at)
+            yield (habit_id, user_id, habit_name, periodicity, last_completed_at, breaks_at,
+                   "broken" if breaks_at <= at else "at risk")
@@ -0,0 +1,108 @@
+#Report across all users: top-k longest streaks, most challenging habits and broken streaks
+"""
+The users are split into shards of consecutive user IDs. Each shard is processed in a worker process
+with the Habit streak rules and analytics.py, and only its top-k lists and counts are sent back,
+so the memory of the merge does not grow with the number of habits:
+python cli.py report --workers 4 --shards 16 --top 10
+"""
+import heapq
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import database
+from database import get_user_id_range, get_habits_by_user_range, stream_completion_history, STREAM_BATCH_SIZE
+from habit import Habit
+from analytics import summarize_ordered
+
+#Number of habits in the top-k lists
+REPORT_TOP_K = 10
+#Shards per worker process, more shards even out users with many habits
+SHARDS_PER_WORKER = 4
+
+#Worker processes start without the shared connection pool of the parent process
+def _init_worker(db_config):
+    database.DB_CONFIG.update(db_config)
+    database.forget_database()
+
+#Splits the user IDs first_user_id..last_user_id into at most `shards` ranges of about the same size
+def shard_ranges(first_user_id, last_user_id, shards):
+    if first_user_id is None:
+        return []
+    size = -(-(last_user_id - first_user_id + 1) // shards) #Rounded up
+    return [(start, min(start + size - 1, last_user_id)) for start in range(first_user_id, last_user_id + 1, size)]
+
+#Adds an entry to a top-k heap (the smallest entry is dropped when the heap is full)
+def push_top(heap, k, entry):
+    if len(heap) < k:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+#Completion dates of the habits grouped by habit (habit ID, iterator of dates), read in batches of habits
+def _completions_by_habit(habit_ids):
+    for i in range(0, len(habit_ids), STREAM_BATCH_SIZE):
+        rows = stream_completion_history(habit_ids[i:i + STREAM_BATCH_SIZE])
+        for habit_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+            yield habit_id, (row[1] for row in group)
+
+#Passes the dates through while advancing the streak of the habit
+def _advancing(habit, completion_dates):
+    for completed_at in completion_dates:
+        habit.advance_streak(completed_at)
+        yield completed_at
+
+#Report of one shard of users, runs in a worker process
+def report_shard(shard, top_k=REPORT_TOP_K):
+    habits = {habit_id: (user_id, habit_name, periodicity)
+              for habit_id, user_id, habit_name, periodicity in get_habits_by_user_range(*shard)}
+    longest_streaks = [] #(longest streak, habit ID, user ID, habit name)
+    challenging_habits = [] #(streak breaks, habit ID, user ID, habit name)
+    broken_streaks = 0
+    completions = 0
+
+    for habit_id, completion_dates in _completions_by_habit(list(habits)):
+        user_id, habit_name, periodicity = habits[habit_id]
+        habit = Habit(name=habit_name, periodicity=periodicity)
+        #The dates arrive in order, so the streak and the analytics are calculated in one streaming pass
+        summary = summarize_ordered(_advancing(habit, completion_dates), periodicity)
+        completions += summary["total completions"]
+        #is_broken only looks at the last completion
+        habit.completion_history.append(habit.last_completed)
+
+        push_top(longest_streaks, top_k, (habit.longest_streak, habit_id, user_id, habit_name))
+        streak_breaks = summary["streak breaks"]
+        if streak_breaks:
+            push_top(challenging_habits, top_k, (streak_breaks, habit_id, user_id, habit_name))
+        if habit.is_broken():
+            broken_streaks += 1
+
+    return {"habits": len(habits), "completions": completions, "broken streaks": broken_streaks,
+            "longest streaks": longest_streaks, "most challenging habits": challenging_habits}
+
+#Merges the shard reports, keeping only the top k entries of each list
+def merge_reports(shard_reports, top_k=REPORT_TOP_K):
+    merged = {"habits": 0, "completions": 0, "broken streaks": 0}
+    longest_streaks = []
+    challenging_habits = []
+    for shard_report in shard_reports:
+        for key in merged:
+            merged[key] += shard_report[key]
+        for entry in shard_report["longest streaks"]:
+            push_top(longest_streaks, top_k, tuple(entry))
+        for entry in shard_report["most challenging habits"]:
+            push_top(challenging_habits, top_k, tuple(entry))
+    merged["longest streaks"] = sorted(longest_streaks, reverse=True)
+    merged["most challenging habits"] = sorted(challenging_habits, reverse=True)
+    return merged
+
+#Runs the report on a process pool and returns the merged results
+def run_report(workers=None, shards=None, top_k=REPORT_TOP_K):
+    workers = workers or os.cpu_count() or 1
+    first_user_id, last_user_id = get_user_id_range()
+    ranges = shard_ranges(first_user_id, last_user_id, shards or workers * SHARDS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(dict(database.DB_CONFIG),)) as executor:
+        shard_reports = executor.map(report_shard, ranges, itertools.repeat(top_k))
+        merged = merge_reports(shard_reports, top_k)
+    merged["shards"] = len(ranges)
+    return merged
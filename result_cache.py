@@ -0,0 +1,108 @@
+#Cache for the results of the analytics and streak commands
+"""
+Results are stored per database, user and command together with the user's data version (Users.data_version).
+User IDs and data versions start again at 1 and 0 in every database, so the key includes the random ID
+of the database (DatabaseInfo table).
+Creating, deleting and completing habits increase the version, so a cached result is only reused
+while the user's data is unchanged. Checking the version is a single primary key lookup.
+The least recently used results are evicted when the cache is full. The "disk" backend keeps the
+results in a file, so that repeated CLI runs can reuse them, the "memory" backend keeps them in the process.
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from database import get_data_version, get_database_id
+
+#Maximum number of cached results
+RESULT_CACHE_SIZE = 256
+#Backend of the shared cache: "memory" or "disk"
+RESULT_CACHE_BACKEND = "disk"
+#File of the disk backend
+RESULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".habittracker", "result_cache.pickle")
+
+#Results of the running process, (database ID, user ID, name) -> (data version, result) in LRU order (oldest first)
+class MemoryBackend:
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def load(self):
+        return self.entries
+
+    def save(self, entries):
+        self.entries = entries
+
+#Results in a file that only the current user can read, replaced atomically when it changes
+class DiskBackend:
+    def __init__(self, path=RESULT_CACHE_PATH):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return OrderedDict()
+
+    def save(self, entries):
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        file_descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, "wb") as file:
+            pickle.dump(entries, file)
+        os.replace(temporary_path, self.path)
+
+BACKENDS = {"memory": MemoryBackend, "disk": DiskBackend}
+
+class ResultCache:
+    def __init__(self, backend=None, size=RESULT_CACHE_SIZE):
+        self.backend = backend or MemoryBackend()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None #Loaded from the backend by the first lookup
+
+    #Cached result of a command for a data version, compute() is called on a miss and its result is stored
+    def get_or_compute(self, user_id, data_version, name, compute, database_id=None):
+        key = (database_id, user_id, name)
+        with self._lock:
+            if self._entries is None:
+                self._entries = self.backend.load()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == data_version:
+                self.hits += 1
+                #The disk backend saves the new order with the next miss, a hit doesn't write the file
+                self._entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+
+        result = compute()
+        with self._lock:
+            self._entries[key] = (data_version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False) #Evict the least recently used result
+            self.backend.save(self._entries)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self.backend.save(self._entries)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries or ())}
+
+#The shared cache is created with the settings above when it is first used
+_result_cache = None
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(BACKENDS[RESULT_CACHE_BACKEND](), RESULT_CACHE_SIZE)
+    return _result_cache
+
+#Result of a command for a user, computed only if the user's data changed since it was cached
+def cached_result(user_id, name, compute):
+    return get_result_cache().get_or_compute(user_id, get_data_version(user_id), name, compute, get_database_id())
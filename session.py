@@ -0,0 +1,86 @@
+#Signed, expiring login sessions so that commands after --login don't need the password (and bcrypt) again
+"""
+A token is "<database ID>.<user ID>.<expiry>.<nonce>.<signature>", signed with HMAC-SHA256 and a random key.
+The key and the last issued token are stored in files that only the current user can read.
+Checking a token needs no bcrypt, only one HMAC. The database ID (database.get_database_id) is part of the
+signed payload, because user IDs repeat between databases (e.g. the test database and the real one).
+Logging out or changing the password replaces the key, which revokes every token issued on this machine.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+#Directory of the key and token files
+SESSION_DIR = os.path.join(os.path.expanduser("~"), ".habittracker")
+KEY_FILE = "session_key"
+TOKEN_FILE = "session_token"
+#Lifetime of a token in seconds
+SESSION_LIFETIME = 12 * 60 * 60
+
+def _path(name):
+    return os.path.join(SESSION_DIR, name)
+
+#Files are created with user-only permissions (0600 in a 0700 directory)
+def _write_private(name, data):
+    os.makedirs(SESSION_DIR, mode=0o700, exist_ok=True)
+    path = _path(name)
+    file_descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(file_descriptor, "wb") as file:
+        file.write(data)
+    os.chmod(path, 0o600)
+
+def _read(name):
+    try:
+        with open(_path(name), "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+def _remove(name):
+    try:
+        os.remove(_path(name))
+    except FileNotFoundError:
+        pass
+
+def _signature(key, payload):
+    return hmac.new(key, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+#Creates a token for a user of a database, saves it as the current session and returns it
+def issue_token(user_id, database_id):
+    key = _read(KEY_FILE)
+    if key is None:
+        key = secrets.token_bytes(32)
+        _write_private(KEY_FILE, key)
+    payload = f"{database_id}.{user_id}.{int(time.time()) + SESSION_LIFETIME}.{secrets.token_hex(8)}"
+    token = f"{payload}.{_signature(key, payload)}"
+    _write_private(TOKEN_FILE, token.encode("utf-8"))
+    return token
+
+#Returns the user ID of a valid token, or None if it is invalid, expired, revoked or of another database
+def verify_token(token, database_id):
+    key = _read(KEY_FILE)
+    if key is None or not token:
+        return None
+    payload, _, signature = token.rpartition(".")
+    if not hmac.compare_digest(_signature(key, payload), signature):
+        return None
+    try:
+        token_database_id, user_id, expires_at, _ = payload.split(".")
+        user_id, expires_at = int(user_id), int(expires_at)
+    except ValueError:
+        return None
+    if expires_at < time.time() or not hmac.compare_digest(token_database_id, database_id):
+        return None
+    return user_id
+
+#Token of the current session (None if there is none)
+def load_token():
+    token = _read(TOKEN_FILE)
+    return token.decode("utf-8") if token else None
+
+#Revokes all tokens issued on this machine
+def revoke_sessions():
+    _remove(KEY_FILE)
+    _remove(TOKEN_FILE)
@@ -2,16 +2,45 @@
 TEST SUITE FOR A DUPLICATED DATABASE (EXACT COPY OF THE REAL DATABASE)
 """
 import pytest
+import argparse
+import os
+import json
 import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector
 from database import (insert_new_user, get_user_by_username, insert_new_habit, delete_habit,
                       display_habits_for_deletion, insert_habit_completion, get_habits_by_user,
-                      get_completion_history_for_habit, get_habits_by_periodicity)
+                      get_completion_history_for_habit, get_completion_history_for_habits,
+                      get_completion_history_for_user, get_habits_by_periodicity,
+                      migrate, get_schema_version, check_query_plans, SCHEMA_VERSION,
+                      get_habit_streak, rebuild_habit_streaks, get_habit_streaks_by_user,
+                      stream_completion_seconds, compute_streaks, get_database, iter_completion_history,
+                      get_data_version, rebuild_habit_rollups, get_period_counts_by_user,
+                      rebuild_habit_completion_counts, get_database_id,
+                      insert_habit_completions)
 from cli import (delete_habit_prompt, create_habit, complete_habit_prompt, view_habit_streak,
                  view_longest_streak, view_longest_streak_across_all_habits, display_user_habits,
-                 display_most_challenging_habit, group_habits_by_periodicity, view_analytics, main)
-from habit import Habit
-from analytics import (average_completion_time, most_consistent_habit, aggregate_streak_analysis)
+                 display_most_challenging_habit, group_habits_by_periodicity, view_analytics, main,
+                 calendar_heatmap, user_habit_streaks, user_habit_summaries)
+from habit import (Habit, CompactHabit, compact_habits_from_rows, to_seconds, streak_from_counts,
+                   break_time, broken_cutoffs)
+from datetime import date, datetime, timedelta
+from analytics import (average_completion_time, most_consistent_habit, aggregate_streak_analysis,
+                       habit_summary, summaries_overview, summarize_ordered)
+import numpy_analytics
+from transfer import import_data, export_data, import_records
+from benchmark import generate_dataset, find_regressions
+from habit_cache import HabitCache
+import asyncio
+import async_database
+import cli
+from report import shard_ranges, merge_reports, report_shard
+from reminders import scan_broken_habits
+import result_cache
+import profiling
+import session
+import random
 
 #Setting up a test database connection
 @pytest.fixture
@@ -38,6 +67,11 @@ def clean_up_database(db_connection):
         #cursor.execute(f"DELETE FROM {table}")
     db.commit()
 
+#Every test starts with an empty result cache in memory
+@pytest.fixture(autouse=True)
+def empty_result_cache(monkeypatch):
+    monkeypatch.setattr(result_cache, "_result_cache", result_cache.ResultCache(result_cache.MemoryBackend()))
+
 #THIS IS NEW
 #Helping fixture for the creation of a new user (makes it easier to create a user before each test)
 @pytest.fixture
@@ -52,6 +86,45 @@ def create_test_user(db_connection):
     cursor.execute("DELETE FROM users WHERE userid = %s", (user[0],)) #changed from id to userid
     db.commit()
 
+#Time of the first completion of habit_with_completions
+START = datetime(2024, 1, 1, 8, 0)
+
+#Helping fixture for a habit of the test user with completions on the given days after START
+#(use: habit_id = habit_with_completions([0, 1, 2]), days can be out of order)
+@pytest.fixture
+def habit_with_completions(create_test_user):
+    def create(days, periodicity="daily", name="Exercise", start=START):
+        habit_id = insert_new_habit(name, periodicity, create_test_user)
+        for day in days:
+            insert_habit_completion(habit_id, start + timedelta(days=day))
+        return habit_id
+    return create
+
+
+#Test the schema migration (running it twice must not change anything)
+def test_migrate(db_connection):
+    db, cursor = db_connection
+
+    migrate()
+    assert migrate() == []
+    assert get_schema_version(cursor) == SCHEMA_VERSION
+
+    #A version whose backfill failed after its columns were added is applied again without errors
+    cursor.execute("DELETE FROM SchemaVersion WHERE version IN (3, 8)")
+    db.commit()
+    assert migrate() == [3, 8]
+    assert get_schema_version(cursor) == SCHEMA_VERSION
+
+#Test that no query needs a full table scan or a filesort. The optimizer prefers table scans on nearly
+#empty tables, so the tables are filled with a seeded data set and their statistics updated first
+def test_query_plans(db_connection):
+    db, cursor = db_connection
+    import_records(generate_dataset(users=50, habits_per_user=6, years=1, prefix="plans"))
+    for table in ["Users", "Habits", "CompletionHistory", "CompletionDaily", "CompletionWeekly", "CompletionMonthly"]:
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+
+    assert check_query_plans() == []
 
 #Test the create user function
 def test_insert_new_user(db_connection):
@@ -182,6 +255,69 @@ def test_get_completion_history_for_habit(db_connection, create_test_user):
 
     assert result is not None
 
+#Test loading the completion history of several habits at once (used for the multi-habit commands)
+def test_get_completion_history_in_bulk(db_connection, create_test_user):
+    db, cursor = db_connection
+    user_id = create_test_user
+
+    #Creation of two habits with one completion each
+    insert_new_habit("Exercise", "daily", user_id)
+    insert_new_habit("Read", "weekly", user_id)
+    habit_ids = [habit[0] for habit in get_habits_by_user(user_id)]
+    for habit_id in habit_ids:
+        insert_habit_completion(habit_id)
+
+    #Both variants return the completions grouped by habit ID
+    by_habits = get_completion_history_for_habits(habit_ids)
+    by_user = get_completion_history_for_user(user_id)
+
+    assert set(by_habits) == set(habit_ids)
+    assert by_habits == by_user
+    assert all(len(dates) == 1 for dates in by_user.values())
+
+#Test that check-offs and history queries can run from several threads at once
+def test_concurrent_database_access(db_connection, create_test_user):
+    db, cursor = db_connection
+    user_id = create_test_user
+    habit_id = insert_new_habit("Exercise", "daily", user_id)
+
+    #Every call borrows its own pooled connection and cursor
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: insert_habit_completion(habit_id), range(20)))
+        results = list(executor.map(lambda _: get_completion_history_for_habit(habit_id), range(20)))
+
+    assert len(get_completion_history_for_habit(habit_id)) == 20
+    assert all(len(result) <= 20 for result in results)
+
+#Test that completing the same habits in opposite orders at the same time doesn't deadlock
+def test_concurrent_completions_in_any_order(create_test_user):
+    habit_ids = [insert_new_habit(name, "daily", create_test_user) for name in ["Exercise", "Read"]]
+    orders = [habit_ids, habit_ids[::-1]] * 10
+    completed_at = datetime(2024, 1, 1, 8, 0)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda order: insert_habit_completions(order, completed_at), orders))
+
+    assert [len(get_completion_history_for_habit(habit_id)) for habit_id in habit_ids] == [20, 20]
+    day = completed_at.date()
+    assert get_period_counts_by_user(create_test_user, "day", day, day) == [(habit_ids[0], day, 20), (habit_ids[1], day, 20)]
+
+#Test that the stored streak matches a full calculation from the completion history
+def test_stored_streak_matches_calculation(habit_with_completions):
+    #Three days in a row, a gap, two days in a row and one completion that arrives out of order
+    habit_id = habit_with_completions([0, 1, 2, 5, 6, 3])
+
+    habit = Habit(name="Exercise", periodicity="daily")
+    habit.completion_history = [completion[0] for completion in get_completion_history_for_habit(habit_id)]
+    habit.calculate_streak()
+
+    assert get_habit_streak(habit_id) == (habit.streak, habit.longest_streak, START + timedelta(days=6))
+    assert habit.longest_streak == 4
+
+    #A rebuild from the history gives the same result
+    rebuild_habit_streaks([habit_id])
+    assert get_habit_streak(habit_id) == (habit.streak, habit.longest_streak, START + timedelta(days=6))
+
 #Test get habits by periodicity (used for grouping the habits) 
 def test_get_habits_by_periodicity(db_connection, create_test_user):
     db, cursor = db_connection
@@ -259,3 +395,460 @@ def test_complete_habit(mock_input, monkeypatch):
     monkeypatch.setattr(sys, 'argv', ['cli.py', '--complete_habit', mock_input])
 
     complete_habit_prompt("22")
+
+#Test that the running streak of check-offs matches a full calculation
+def test_add_completion_matches_calculate_streak():
+    start = datetime(2024, 1, 1, 8, 0)
+    completions = [start + timedelta(days=day) for day in [0, 1, 2, 4, 5, 6, 7, 3]] #Last one out of order
+
+    habit = Habit(name="Exercise", periodicity="daily")
+    for completion in completions:
+        habit.add_completion(completion)
+
+    recalculated = Habit(name="Exercise", periodicity="daily")
+    recalculated.completion_history = list(completions)
+    recalculated.calculate_streak()
+
+    assert (habit.streak, habit.longest_streak) == (recalculated.streak, recalculated.longest_streak)
+    assert habit.longest_streak == 8
+
+#Test that the vectorized analytics engine gives the same results as analytics.py
+def test_numpy_analytics_parity():
+    random.seed(42)
+    start = datetime(2023, 1, 1)
+    habit_data = {
+        f"Habit {i}": [start + timedelta(days=random.randint(0, 60), seconds=random.randint(0, 86399))
+                       for _ in range(random.randint(0, 30))]
+        for i in range(20)
+    }
+
+    for dates in habit_data.values():
+        assert numpy_analytics.average_completion_time(dates) == average_completion_time(dates)
+    assert numpy_analytics.most_consistent_habit(habit_data) == most_consistent_habit(habit_data)
+    assert numpy_analytics.aggregate_streak_analysis(habit_data) == aggregate_streak_analysis(habit_data)
+
+#Test that the single-pass habit summary matches the separate analytics functions
+def test_habit_summary_matches_analytics():
+    start = datetime(2024, 1, 1, 8, 0)
+    habit_data = {
+        "Exercise": [start + timedelta(days=day) for day in [0, 1, 2, 5, 6, 9]],
+        "Read": [start + timedelta(days=day) for day in [0, 7, 14, 21]],
+        "Journal": [start],
+    }
+    summaries = {habit: habit_summary(dates, "daily") for habit, dates in habit_data.items()}
+
+    for habit, dates in habit_data.items():
+        assert summaries[habit]["average gap"] == average_completion_time(dates)
+    assert summaries["Exercise"]["streak breaks"] == 2
+    assert summaries["Exercise"]["longest run"] == 3
+    assert summaries_overview(summaries) == (most_consistent_habit(habit_data), aggregate_streak_analysis(habit_data))
+
+#Test that an export can be imported again (JSONL and CSV)
+@pytest.mark.parametrize("file_format", ["jsonl", "csv"])
+def test_export_and_import(tmp_path, file_format, habit_with_completions):
+    habit_with_completions(range(3))
+
+    path = tmp_path / f"export.{file_format}"
+    rows, _ = export_data(str(path), usernames=["testuser"])
+    assert rows == 5 #One user, one habit and three completions
+
+    #Import the data again as a new user
+    path.write_text(path.read_text().replace("testuser", "importeduser"))
+    rows, _ = import_data(str(path))
+    assert rows == 5
+
+    imported_user_id = get_user_by_username("importeduser")[0]
+    imported_habit = get_habit_streaks_by_user(imported_user_id)[0]
+    assert imported_habit[1:5] == ("Exercise", "daily", 3, 3)
+
+#Test that an import that failed partway can be run again and that the error names the line
+def test_import_rerun(tmp_path):
+    path = tmp_path / "import.jsonl"
+    path.write_text('{"type": "user", "username": "importeduser", "password": "password"}\n'
+                    '{"type": "completion", "habit_id": 1, "completedate": "2024-01-01 08:00:00"}\n')
+    with pytest.raises(ValueError, match="Line 2"):
+        import_data(str(path))
+    user_id = get_user_by_username("importeduser")[0]
+
+    path.write_text('{"type": "user", "username": "importeduser", "password": "password"}\n')
+    assert import_data(str(path))[0] == 1
+    assert get_user_by_username("importeduser")[0] == user_id
+
+#Test completing several habits at once
+def test_complete_several_habits(db_connection, create_test_user):
+    db, cursor = db_connection
+    user_id = create_test_user
+    habit_ids = [insert_new_habit(name, "daily", user_id) for name in ["Exercise", "Read", "Journal"]]
+
+    complete_habit_prompt(user_id, [str(habit_ids[0]), str(habit_ids[2])])
+    history = get_completion_history_for_habits(habit_ids)
+    assert [len(history[habit_id]) for habit_id in habit_ids] == [1, 0, 1]
+
+    complete_habit_prompt(user_id, ["all"])
+    history = get_completion_history_for_habits(habit_ids)
+    assert [len(history[habit_id]) for habit_id in habit_ids] == [2, 1, 2]
+
+#Test that the compact habit gives the same streaks as Habit
+def test_compact_habit_matches_habit():
+    start = datetime(2024, 1, 1, 8, 0)
+    for periodicity in ["daily", "weekly", "monthly"]:
+        completions = [start + timedelta(days=day) for day in [0, 1, 2, 7, 14, 15, 21, 40, 3]]
+
+        habit = Habit(name="Exercise", periodicity=periodicity)
+        habit.completion_history = list(completions)
+        habit.calculate_streak()
+        compact_habit = CompactHabit.from_rows("Exercise", periodicity, [(completion,) for completion in completions])
+
+        assert (compact_habit.streak, compact_habit.longest_streak) == (habit.streak, habit.longest_streak)
+        assert compact_habit.completion_history.tolist() == [to_seconds(completion) for completion in completions]
+
+#Test loading compact habits straight from the database rows
+def test_compact_habits_from_database(create_test_user, habit_with_completions):
+    user_id = create_test_user
+    start = datetime(2024, 1, 1, 8, 30, 15)
+    habit_id = habit_with_completions([0, 1, 2, 4], start=start)
+
+    habits = get_habits_by_user(user_id)
+    compact_habit = compact_habits_from_rows(habits, stream_completion_seconds([habit_id]))[habit_id]
+
+    assert compact_habit.completion_history[0] == to_seconds(start)
+    assert (compact_habit.streak, compact_habit.longest_streak) == get_habit_streak(habit_id)[:2]
+
+#Differential test of the Python and the SQL streak engine on generated data
+def test_streak_engines_match(create_test_user):
+    user_id = create_test_user
+    random.seed(7)
+    start = datetime(2023, 11, 20)
+    expected = {}
+    for periodicity in ["daily", "weekly", "monthly"]:
+        for i in range(5):
+            habit_id = insert_new_habit(f"{periodicity} {i}", periodicity, user_id)
+            #Mix of consecutive days, whole weeks and random gaps (including several completions per day)
+            days = sorted(random.choice([random.randint(0, 120), 7 * random.randint(0, 17)]) for _ in range(40))
+            completions = [start + timedelta(days=day, seconds=random.randint(0, 86399)) for day in days]
+            get_database().insert_completions([(habit_id, completion) for completion in completions])
+
+            habit = Habit(name=habit_id, periodicity=periodicity)
+            habit.completion_history = completions
+            habit.calculate_streak()
+            expected[habit_id] = (habit.streak, habit.longest_streak, max(completions))
+    #A habit without completions
+    expected[insert_new_habit("Never done", "daily", user_id)] = (0, 0, None)
+
+    assert compute_streaks(expected, "python") == expected
+    assert compute_streaks(expected, "sql") == expected
+    assert compute_streaks(expected, "rollup") == expected
+
+#Test that the benchmark data generator is reproducible
+def test_generate_dataset():
+    records = list(generate_dataset(users=2, habits_per_user=3, years=1, seed=1))
+
+    assert records == list(generate_dataset(users=2, habits_per_user=3, years=1, seed=1))
+    assert sum(record["type"] == "user" for record in records) == 2
+    assert {record["periodicity"] for record in records if record["type"] == "habit"} == {"daily", "weekly", "monthly"}
+
+#Test the comparison of two benchmark runs
+def test_find_regressions():
+    baseline = {"results": {"fast": {"min_seconds": 1.0}, "slow": {"min_seconds": 1.0}}}
+    report = {"results": {"fast": {"min_seconds": 1.1}, "slow": {"min_seconds": 1.5}, "new": {"min_seconds": 9.0}}}
+
+    assert find_regressions(report, baseline, tolerance=0.2) == ["slow: 1.000000s -> 1.500000s"]
+
+#Test that instrumented functions are only recorded while profiling is enabled
+def test_profiling(monkeypatch, capsys):
+    profiling.reset()
+    dates = [datetime(2024, 1, 1) + timedelta(days=day) for day in range(5)]
+
+    habit_summary(dates)
+    assert "analytics.habit_summary" not in profiling.snapshot()["functions"]
+
+    monkeypatch.setattr(profiling, "enabled", True)
+    habit_summary(dates)
+    habit_summary(dates)
+    assert profiling.snapshot()["functions"]["analytics.habit_summary"]["calls"] == 2
+
+    #With --format json the table is written to stderr instead of after the JSON document
+    profiling.report("analytics", stream=sys.stderr)
+    output = capsys.readouterr()
+    assert output.out == "" and "analytics.habit_summary" in output.err
+
+#Test that session tokens are verified, expire and are revoked
+def test_session_tokens(tmp_path, monkeypatch):
+    monkeypatch.setattr(session, "SESSION_DIR", str(tmp_path / "sessions"))
+
+    token = session.issue_token(7, "database")
+    assert session.verify_token(token, "database") == 7
+    assert session.load_token() == token
+    assert session.verify_token(token[:-1] + ("0" if token[-1] != "0" else "1"), "database") is None
+    #A session of another database (e.g. the test database) is not valid
+    assert session.verify_token(token, "other database") is None
+    assert oct(os.stat(tmp_path / "sessions" / session.KEY_FILE).st_mode & 0o777) == "0o600"
+
+    monkeypatch.setattr(session, "SESSION_LIFETIME", -1)
+    assert session.verify_token(session.issue_token(7, "database"), "database") is None
+
+    session.revoke_sessions()
+    assert session.verify_token(token, "database") is None
+    assert session.load_token() is None
+
+#Test that a saved session is only used for the user it belongs to
+def test_session_other_username(tmp_path, monkeypatch):
+    monkeypatch.setattr(session, "SESSION_DIR", str(tmp_path / "sessions"))
+    insert_new_user("bob", "password")
+    bob_id = get_user_by_username("bob")[0]
+    args = argparse.Namespace(password=None, token=session.issue_token(bob_id + 1, get_database_id()), username="bob")
+
+    assert cli.login_with_args(args) is None
+    args.token = session.issue_token(bob_id, get_database_id())
+    assert cli.login_with_args(args) == bob_id
+
+#Test that the password is only changed with the current password, also with a saved session
+def test_change_password_needs_current_password(tmp_path, monkeypatch):
+    monkeypatch.setattr(session, "SESSION_DIR", str(tmp_path / "sessions"))
+    cli.create_account_result("bob", "old password")
+    bob_id = get_user_by_username("bob")[0]
+
+    with pytest.raises(cli.ActionError):
+        cli.change_password_result(bob_id, "wrong password", "new password")
+    with pytest.raises(cli.ActionError):
+        cli.change_password_result(bob_id, None, "new password")
+    assert cli.change_password_result(bob_id, "old password", "new password") == {"password changed": True}
+    args = argparse.Namespace(password="new password", token=None, username="bob")
+    assert cli.authenticate(args) == (bob_id, True)
+
+#Test that the habit cache of the interactive menu stays equal to the database
+def test_habit_cache_matches_database(create_test_user, habit_with_completions):
+    user_id = create_test_user
+    habit_id = habit_with_completions([0, 1, 3])
+
+    cache = HabitCache(user_id)
+    new_habit_id = cache.insert_new_habit("Read", "weekly")
+    cache.insert_habit_completions([habit_id, new_habit_id], START + timedelta(days=4))
+    complete_habit_prompt(user_id, ["all"], cache=cache)
+
+    assert cache.get_habits_by_user() == get_habits_by_user(user_id)
+    assert cache.get_habit_streaks_by_user() == get_habit_streaks_by_user(user_id)
+    assert cache.get_completion_history_for_user() == get_completion_history_for_user(user_id)
+
+    assert cache.delete_habit(new_habit_id)
+    assert cache.get_habits_by_user() == get_habits_by_user(user_id)
+
+#Test that the async analytics fetch every habit and give the same results as the blocking functions
+def test_async_analytics(create_test_user, habit_with_completions):
+    user_id = create_test_user
+    habit_data = {}
+    for habit_name, days in [("Exercise", [0, 1, 2, 5]), ("Read", [0, 3, 6, 9])]:
+        habit_with_completions(days, name=habit_name)
+        habit_data[habit_name] = [START + timedelta(days=day) for day in days]
+
+    window = {"since": date(2024, 1, 2), "until": date(2024, 1, 7)}
+    async def run():
+        async with async_database.AsyncHabitDatabase() as database:
+            return (await async_database.user_analytics(database, user_id),
+                    await async_database.longest_streak_across_all_habits(database, user_id),
+                    await async_database.user_analytics(database, user_id, **window))
+    analytics, longest_streak, window_analytics = asyncio.run(run())
+
+    assert analytics["average completion time"] == {habit: average_completion_time(dates) for habit, dates in habit_data.items()}
+    assert analytics["most consistent habit"] == most_consistent_habit(habit_data)
+    assert analytics["aggregate streaks"] == aggregate_streak_analysis(habit_data)
+    assert longest_streak == ("Exercise", 3)
+    #With a time window the results are the same as those of the analytics command
+    assert window_analytics == cli.analytics_result(user_id, **window)
+
+#Test the shards and the top-k merge of the report
+def test_report_merge():
+    assert shard_ranges(1, 10, 3) == [(1, 4), (5, 8), (9, 10)]
+    assert shard_ranges(None, None, 3) == []
+
+    shard_reports = [{"habits": 2, "completions": 10, "broken streaks": 1,
+                      "longest streaks": [(3, 1, 1, "Read"), (5, 2, 1, "Walk")], "most challenging habits": [(4, 1, 1, "Read")]},
+                     {"habits": 1, "completions": 4, "broken streaks": 0,
+                      "longest streaks": [(4, 3, 2, "Yoga")], "most challenging habits": []}]
+    report = merge_reports(shard_reports, top_k=2)
+
+    assert (report["habits"], report["completions"], report["broken streaks"]) == (3, 14, 1)
+    assert report["longest streaks"] == [(5, 2, 1, "Walk"), (4, 3, 2, "Yoga")]
+    assert report["most challenging habits"] == [(4, 1, 1, "Read")]
+
+#Test that a report shard finds the same streaks as the stored streak state
+def test_report_shard(create_test_user, habit_with_completions):
+    user_id = create_test_user
+    habit_id = habit_with_completions([0, 1, 2, 4, 10])
+
+    shard_report = report_shard((user_id, user_id))
+
+    assert shard_report["completions"] == 5
+    assert shard_report["longest streaks"] == [(get_habit_streak(habit_id)[1], habit_id, user_id, "Exercise")]
+    assert shard_report["broken streaks"] == 1
+
+#Test that the streamed completion history gives the same streaks and analytics in one pass
+def test_iter_completion_history(habit_with_completions):
+    days = [5, 0, 1, 2, 9, 3]
+    habit_id = habit_with_completions(days)
+    completions = [START + timedelta(days=day) for day in days]
+
+    assert list(iter_completion_history(habit_id, batch_size=2)) == sorted(completions)
+
+    habit = Habit(name="Exercise", periodicity="daily")
+    assert habit.streak_from_completions(iter_completion_history(habit_id)) == get_habit_streak(habit_id)[:2]
+    assert summarize_ordered(iter_completion_history(habit_id), "daily") == habit_summary(completions, "daily")
+
+#Test the LRU eviction and the hit and miss counters of the result cache (in memory and on disk)
+@pytest.mark.parametrize("backend", ["memory", "disk"])
+def test_result_cache(tmp_path, backend):
+    make_backend = lambda: (result_cache.MemoryBackend() if backend == "memory"
+                            else result_cache.DiskBackend(str(tmp_path / "results.pickle")))
+    cache = result_cache.ResultCache(make_backend(), size=2)
+    computed = []
+    def compute(value):
+        computed.append(value)
+        return value
+
+    assert cache.get_or_compute(1, 0, "analytics", lambda: compute("a")) == "a"
+    assert cache.get_or_compute(1, 0, "analytics", lambda: compute("b")) == "a"
+    assert cache.get_or_compute(1, 1, "analytics", lambda: compute("c")) == "c" #New data version
+    cache.get_or_compute(2, 0, "analytics", lambda: compute("d"))
+    cache.get_or_compute(3, 0, "analytics", lambda: compute("e")) #Evicts user 1
+    assert cache.get_or_compute(1, 1, "analytics", lambda: compute("f")) == "f"
+    assert computed == ["a", "c", "d", "e", "f"]
+    assert (cache.hits, cache.misses) == (1, 5)
+
+    if backend == "disk":
+        #A new process reads the results from the file
+        assert result_cache.ResultCache(make_backend(), size=2).get_or_compute(1, 1, "analytics", lambda: compute("g")) == "f"
+        #The same user ID and data version in another database is a different result
+        assert result_cache.ResultCache(make_backend(), size=2).get_or_compute(1, 1, "analytics", lambda: compute("h"),
+                                                                               database_id="other") == "h"
+
+#Test that changes of the habits and completions increase the data version of the user
+def test_data_version(db_connection, create_test_user):
+    user_id = create_test_user
+    version = get_data_version(user_id)
+
+    habit_id = insert_new_habit("Exercise", "daily", user_id)
+    assert get_data_version(user_id) == version + 1
+    insert_habit_completion(habit_id)
+    assert get_data_version(user_id) == version + 2
+    delete_habit(habit_id, user_id)
+    assert get_data_version(user_id) == version + 3
+
+#Test that the streaks from completion counts per day or month match the Habit rules
+def test_streak_from_counts_matches_habit():
+    random.seed(11)
+    for periodicity in ["daily", "weekly", "monthly"]:
+        for _ in range(50):
+            completions = [datetime(2024, 1, 1) + timedelta(days=random.randint(0, 90), seconds=random.randint(0, 86399))
+                           for _ in range(random.randint(0, 20))]
+            habit = Habit(name="Exercise", periodicity=periodicity)
+            habit.completion_history = completions
+            habit.calculate_streak()
+
+            periods = [completion.date().replace(day=1) if periodicity == "monthly" else completion.date()
+                       for completion in completions]
+            counts = sorted(Counter(periods).items())
+            assert streak_from_counts(periodicity, counts) == (habit.streak, habit.longest_streak)
+
+#Test that the rollup tables are kept up to date by inserts and match a rebuild
+def test_rollup_tables(db_connection, create_test_user):
+    user_id = create_test_user
+    habit_id = insert_new_habit("Exercise", "daily", user_id)
+    #Monday 1 January 2024, twice on Tuesday and once in February
+    for completion in [datetime(2024, 1, 1, 8), datetime(2024, 1, 2, 8), datetime(2024, 1, 2, 20), datetime(2024, 2, 5, 8)]:
+        insert_habit_completion(habit_id, completion)
+    first_day, last_day = datetime(2024, 1, 1), datetime(2024, 12, 31)
+
+    counts = {period: get_period_counts_by_user(user_id, period, first_day, last_day) for period in ["day", "week", "month"]}
+    assert [row[2] for row in counts["day"]] == [1, 2, 1]
+    assert [(row[1].isoformat(), row[2]) for row in counts["week"]] == [("2024-01-01", 3), ("2024-02-05", 1)]
+    assert [(row[1].isoformat(), row[2]) for row in counts["month"]] == [("2024-01-01", 3), ("2024-02-01", 1)]
+
+    rebuild_habit_rollups([habit_id])
+    assert {period: get_period_counts_by_user(user_id, period, first_day, last_day) for period in counts} == counts
+
+    heatmap = calendar_heatmap({row[1]: row[2] for row in counts["day"]}, 2024)
+    assert heatmap[1].startswith("Mon +") and heatmap[2].startswith("Tue *")
+
+#Test that the time window filters the completion history and the streaks calculated from it
+def test_time_window(create_test_user, habit_with_completions):
+    user_id = create_test_user
+    habit_id = habit_with_completions([0, 1, 2, 9, 10, 19]) #1, 2, 3, 10, 11 and 20 January
+    since, until = date(2024, 1, 2), date(2024, 1, 11)
+
+    assert [row[0].day for row in get_completion_history_for_habit(habit_id, since, until)] == [11, 10, 3, 2]
+    assert [completion.day for completion in iter_completion_history(habit_id, since=since)] == [2, 3, 10, 11, 20]
+    assert get_completion_history_for_user(user_id, until=until)[habit_id][0] == datetime(2024, 1, 11, 8)
+
+    assert user_habit_streaks(user_id, since=since, until=until) == [(habit_id, "Exercise", "daily", 2, 2, datetime(2024, 1, 11, 8))]
+    habits, summaries = user_habit_summaries(user_id, since=since, until=until)
+    assert summaries[habit_id]["total completions"] == 4
+
+#Test that the broken streak scan uses the same rules as Habit.is_broken
+def test_scan_broken_habits(db_connection, create_test_user):
+    user_id = create_test_user
+    at = datetime(2024, 3, 15, 12)
+    daily_id = insert_new_habit("Exercise", "daily", user_id)
+    weekly_id = insert_new_habit("Groceries", "weekly", user_id)
+    monthly_id = insert_new_habit("Budget", "monthly", user_id)
+    insert_new_habit("Never done", "daily", user_id)
+    insert_habit_completion(daily_id, datetime(2024, 3, 13, 22)) #Broken since 15 March
+    insert_habit_completion(weekly_id, datetime(2024, 3, 8, 8)) #Breaks on 16 March
+    insert_habit_completion(monthly_id, datetime(2024, 3, 1, 8)) #Breaks on 1 May
+
+    assert [row[0] for row in scan_broken_habits(at=at, shards=2)] == [daily_id]
+    at_risk = {row[0]: row[5:] for row in scan_broken_habits(horizon_days=1, at=at)}
+    assert at_risk == {daily_id: (datetime(2024, 3, 15), "broken"), weekly_id: (datetime(2024, 3, 16, 8), "at risk")}
+
+    #The monthly rule counts calendar months, also across the end of the year
+    for last_completed, now, broken in [(datetime(2023, 12, 5), datetime(2023, 12, 20), False),
+                                        (datetime(2023, 12, 5), datetime(2024, 1, 31), False),
+                                        (datetime(2023, 12, 5), datetime(2024, 2, 1), True)]:
+        assert (last_completed < broken_cutoffs(now)["monthly"]) == broken
+        assert (break_time("monthly", last_completed) <= now) == broken
+
+#Test that the completion count and last completion are kept with the habits and can be repaired
+def test_completion_counts(db_connection, create_test_user, habit_with_completions):
+    db, cursor = db_connection
+    user_id = create_test_user
+    habit_id = habit_with_completions([1, 0, 2])
+    get_database().insert_completions([(habit_id, datetime(2024, 1, 5, 8)), (habit_id, datetime(2024, 1, 4, 8))])
+
+    expected = [(habit_id, "Exercise", "daily", 5, datetime(2024, 1, 5, 8))]
+    assert get_habits_by_user(user_id) == expected
+    assert [habit[4:] for habit in get_habits_by_periodicity(user_id, "daily")] == [(5, datetime(2024, 1, 5, 8))]
+
+    cursor.execute("UPDATE Habits SET completion_count = 0, last_completed_at = NULL WHERE habitID = %s", (habit_id,))
+    db.commit()
+    version = get_data_version(user_id)
+    rebuild_habit_completion_counts([habit_id])
+    assert get_habits_by_user(user_id) == expected
+    #The repair marks the cached results of the user as outdated
+    assert get_data_version(user_id) == version + 1
+
+#Test that --format json writes one JSON document per action and that the habits don't print
+def test_json_output(create_test_user, habit_with_completions, tmp_path, monkeypatch, capsys):
+    user_id = create_test_user
+    monkeypatch.setattr(session, "SESSION_DIR", str(tmp_path / "sessions"))
+    token = session.issue_token(user_id, get_database_id())
+    habit_id = habit_with_completions([0, 1, 2])
+
+    habit = Habit(name="Exercise", periodicity="daily")
+    habit.completion_history = [datetime(2024, 1, day, 8) for day in [1, 2, 3]]
+    assert habit.calculate_streak() == (3, 3)
+    habit.is_broken()
+    assert capsys.readouterr().out == ""
+
+    def run(*argv):
+        monkeypatch.setattr(sys, "argv", ["cli.py", "--format", "json", "--login", "--token", token, *argv])
+        main()
+        output = capsys.readouterr().out
+        assert output.count("\n") == 1
+        return json.loads(output)
+
+    assert run("--view_all_streaks") == {"habit": {"id": habit_id, "name": "Exercise", "periodicity": "daily"},
+                                         "longest streak": 3}
+    assert run("--display_habits")["habits"][0]["last completed"] == "2024-01-03T08:00:00"
+    assert run("--group_habits", "--periodicity", "daily") == {"daily": [{"id": habit_id, "name": "Exercise", "completions": 3}]}
+    assert run("--complete_habit", str(habit_id))["completed"][0]["id"] == habit_id
+    with pytest.raises(SystemExit):
+        run("--view_streak", "--habit_id", str(habit_id + 1))
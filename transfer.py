@@ -0,0 +1,171 @@
+#Streaming bulk import and export of users, habits and completions (CSV or JSONL files)
+"""
+Every line of a file is one record: a user, a habit or a completion.
+Exports write all users first, then all habits, then all completions, and imports expect the same order.
+Habits keep the habit ID of the exporting database so that completions can refer to them.
+Imports are written in batches of one transaction each. Users that already exist are mapped to the
+existing account, so an import that failed partway can be run again.
+"""
+import csv
+import json
+import time
+from datetime import datetime
+from database import get_database
+
+#Number of rows per multi-row insert and per transaction
+IMPORT_BATCH_SIZE = 5000
+
+#Columns of the CSV format (cells that do not belong to a record type stay empty)
+CSV_COLUMNS = ["type", "username", "password", "habit_id", "habitname", "periodicity", "created_at", "completedate"]
+
+FILE_FORMATS = ["csv", "jsonl"]
+
+#File format from the file extension
+def format_from_path(path):
+    file_format = path.rsplit(".", 1)[-1].lower()
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"Unknown file format '{file_format}'. Please use one of: {', '.join(FILE_FORMATS)}.")
+    return file_format
+
+#Reads the records of a file one at a time as (line number, record) pairs, the line is used in error messages
+def read_numbered_records(file, file_format):
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if value != ""}
+    else:
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                yield line_number, json.loads(line)
+
+#Writes records one at a time
+class RecordWriter:
+    def __init__(self, file, file_format):
+        self.file = file
+        self.file_format = file_format
+        if file_format == "csv":
+            self._csv = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self.file_format == "csv":
+            self._csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+
+#Exports all data (or the data of some users) and returns (rows written, seconds)
+def export_data(path, file_format=None, usernames=None):
+    database = get_database()
+    start = time.perf_counter()
+    rows = 0
+    with open(path, "w", newline="") as file:
+        writer = RecordWriter(file, file_format or format_from_path(path))
+        for username, password in database.stream_users(usernames):
+            writer.write({"type": "user", "username": username, "password": password})
+            rows += 1
+        for habit_id, username, habit_name, periodicity, created_at in database.stream_habits(usernames):
+            writer.write({"type": "habit", "habit_id": habit_id, "username": username, "habitname": habit_name,
+                          "periodicity": periodicity, "created_at": created_at.isoformat(sep=" ")})
+            rows += 1
+        for habit_id, completedate in database.stream_completions(usernames):
+            writer.write({"type": "completion", "habit_id": habit_id, "completedate": completedate.isoformat(sep=" ")})
+            rows += 1
+    return rows, time.perf_counter() - start
+
+#Collects imported records and writes them in batches
+class _Importer:
+    def __init__(self, database, batch_size=IMPORT_BATCH_SIZE):
+        self.database = database
+        self.batch_size = batch_size
+        self.rows = 0
+        self.users = []
+        self.habits = []
+        self.completions = []
+        #IDs in the file -> IDs in this database (one entry per user and habit, not per completion)
+        self.user_ids = {}
+        self.habit_ids = {}
+        self.completed_habit_ids = set()
+
+    #line is the line of the record in the file, used in error messages
+    def add(self, record, line):
+        record_type = record.get("type")
+        if record_type == "user":
+            self.users.append((record["username"], record["password"]))
+            if len(self.users) >= self.batch_size:
+                self.flush_users()
+        elif record_type == "habit":
+            #Habits refer to users, which must be written first
+            self.flush_users()
+            self.habits.append(record)
+            if len(self.habits) >= self.batch_size:
+                self.flush_habits()
+        elif record_type == "completion":
+            #Completions refer to habits, which must be written first
+            self.flush_habits()
+            habit_id = self.habit_ids.get(int(record["habit_id"]))
+            if habit_id is None:
+                raise ValueError(f"Line {line}: the completion refers to habit ID {record['habit_id']}, "
+                                 "which is not a habit of the file.")
+            self.completions.append((habit_id, datetime.fromisoformat(record["completedate"])))
+            self.completed_habit_ids.add(habit_id)
+            if len(self.completions) >= self.batch_size:
+                self.flush_completions()
+        else:
+            raise ValueError(f"Line {line}: unknown record type: {record_type}")
+        self.rows += 1
+
+    def flush_users(self):
+        if self.users:
+            self.user_ids.update(self.database.insert_users(self.users))
+            self.users = []
+
+    def flush_habits(self):
+        if not self.habits:
+            return
+        rows = [(habit["habitname"], habit["periodicity"], datetime.fromisoformat(habit["created_at"]),
+                 self._user_id(habit["username"])) for habit in self.habits]
+        new_ids = self.database.insert_habits(rows)
+        for habit, new_id in zip(self.habits, new_ids):
+            self.habit_ids[int(habit["habit_id"])] = new_id
+        self.habits = []
+
+    def flush_completions(self):
+        self.database.insert_completions(self.completions)
+        self.completions = []
+
+    def finish(self):
+        self.flush_users()
+        self.flush_habits()
+        self.flush_completions()
+        #Fill the stored streaks of the habits that received completions
+        habit_ids = list(self.completed_habit_ids)
+        for i in range(0, len(habit_ids), self.batch_size):
+            self.database.rebuild_habit_streaks(habit_ids[i:i + self.batch_size])
+
+    #Users of the file, or existing users of this database
+    def _user_id(self, username):
+        if username not in self.user_ids:
+            user = self.database.get_user_by_username(username)
+            if user is None:
+                raise ValueError(f"Habit refers to unknown user '{username}'.")
+            self.user_ids[username] = user[0]
+        return self.user_ids[username]
+
+#Imports (line number, record) pairs and returns (rows read, seconds)
+def _import_numbered_records(numbered_records):
+    importer = _Importer(get_database())
+    start = time.perf_counter()
+    for line, record in numbered_records:
+        importer.add(record, line)
+    importer.finish()
+    return importer.rows, time.perf_counter() - start
+
+#Imports records (dictionaries in the file format) and returns (rows read, seconds)
+#Errors name the number of the record, which is its line in a JSONL file
+def import_records(records):
+    return _import_numbered_records(enumerate(records, 1))
+
+#Imports a file and returns (rows read, seconds)
+def import_data(path, file_format=None):
+    with open(path, newline="") as file:
+        return _import_numbered_records(read_numbered_records(file, file_format or format_from_path(path)))